@@ -0,0 +1,130 @@
+import os
+import hmac
+import time
+import struct
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Optional
+from pyrogram.crypto import aes
+from config import BOT_TOKEN, MEDIA_AUTH_DB, MEDIA_AUTH_SECRET
+
+VERSION = b"\x01"
+NONCE_SIZE = 16
+TAG_SIZE = 32
+KEY_CONTEXT = struct.Struct(">qBB")
+
+secret = (MEDIA_AUTH_SECRET or hashlib.sha256(f"media-auth:{BOT_TOKEN}".encode()).hexdigest()).encode()
+
+
+class MediaAuthStore:
+    def __init__(self, path: str, secret: bytes = secret):
+        """
+        A SQLite store of the auth keys of foreign DC media sessions keyed by (bot user id, DC, test mode),
+        so that a restart reuses them instead of repeating the DH handshake and ExportAuthorization per DC.
+
+        Keys are encrypted with AES-256-CTR and authenticated with HMAC-SHA256 over the key context,
+        so a row copied to another bot or DC is rejected rather than used.
+
+        Attributes:
+            path: database file, empty to disable the store.
+            secret: key material the cipher and MAC keys are derived from.
+        """
+        self.path = path
+        self.cipher_key = hashlib.sha256(b"cipher:" + secret).digest()
+        self.mac_key = hashlib.sha256(b"mac:" + secret).digest()
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS media_keys (user_id INTEGER NOT NULL, dc_id INTEGER NOT NULL, "
+                "test_mode INTEGER NOT NULL, data BLOB NOT NULL, updated REAL NOT NULL, PRIMARY KEY (user_id, dc_id, test_mode))"
+            )
+            connection.commit()
+            if os.name == "posix":
+                os.chmod(self.path, 0o600)
+            self.connection = connection
+        return self.connection
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(query, params).fetchall()
+            connection.commit()
+            return rows
+
+    async def execute(self, query: str, params: tuple = ()) -> list:
+        return await asyncio.to_thread(self._execute, query, params)
+
+    def seal(self, auth_key: bytes, context: bytes) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        body = aes.ctr256_encrypt(auth_key, self.cipher_key, bytearray(nonce), bytearray(1))
+        tag = hmac.new(self.mac_key, VERSION + context + nonce + body, hashlib.sha256).digest()
+        return VERSION + nonce + body + tag
+
+    def unseal(self, data: bytes, context: bytes) -> Optional[bytes]:
+        """Returns the auth key in data, or None if it was written with another secret, context or format."""
+        if len(data) <= 1 + NONCE_SIZE + TAG_SIZE or data[:1] != VERSION:
+            return None
+        nonce, body, tag = data[1:1 + NONCE_SIZE], data[1 + NONCE_SIZE:-TAG_SIZE], data[-TAG_SIZE:]
+        expected = hmac.new(self.mac_key, VERSION + context + nonce + body, hashlib.sha256).digest()
+        if not hmac.compare_digest(tag, expected):
+            return None
+        return aes.ctr256_decrypt(body, self.cipher_key, bytearray(nonce), bytearray(1))
+
+    async def get(self, user_id: int, dc_id: int, test_mode: bool) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        try:
+            rows = await self.execute(
+                "SELECT data FROM media_keys WHERE user_id = ? AND dc_id = ? AND test_mode = ?",
+                (user_id, dc_id, int(test_mode))
+            )
+        except sqlite3.Error:
+            logging.warning(f"Failed to read media auth key for DC {dc_id} of {user_id}", exc_info=True)
+            return None
+        if not rows:
+            return None
+        auth_key = self.unseal(rows[0][0], KEY_CONTEXT.pack(user_id, dc_id, int(test_mode)))
+        if auth_key is None:
+            logging.warning(f"Discarding unreadable media auth key for DC {dc_id} of {user_id}")
+            await self.delete(user_id, dc_id, test_mode)
+        return auth_key
+
+    async def put(self, user_id: int, dc_id: int, test_mode: bool, auth_key: bytes) -> None:
+        if not self.enabled:
+            return
+        data = self.seal(auth_key, KEY_CONTEXT.pack(user_id, dc_id, int(test_mode)))
+        try:
+            await self.execute(
+                "INSERT OR REPLACE INTO media_keys (user_id, dc_id, test_mode, data, updated) VALUES (?, ?, ?, ?, ?)",
+                (user_id, dc_id, int(test_mode), data, time.time())
+            )
+        except sqlite3.Error:
+            logging.warning(f"Failed to write media auth key for DC {dc_id} of {user_id}", exc_info=True)
+
+    async def delete(self, user_id: int, dc_id: int, test_mode: bool) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.execute(
+                "DELETE FROM media_keys WHERE user_id = ? AND dc_id = ? AND test_mode = ?",
+                (user_id, dc_id, int(test_mode))
+            )
+        except sqlite3.Error:
+            logging.warning(f"Failed to delete media auth key for DC {dc_id} of {user_id}", exc_info=True)
+
+
+auth_store = MediaAuthStore(MEDIA_AUTH_DB)
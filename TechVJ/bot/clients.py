@@ -1,45 +1,44 @@
 # (c) adarsh-goel
 
-import asyncio
 import logging
-from config import API_HASH, API_ID, MULTI_CLIENT, SLEEP_THRESHOLD
+from config import API_HASH, API_ID, BOT_TOKEN, SLEEP_THRESHOLD
 from pyrogram import Client
-from TechVJ.utils.config_parser import TokenParser
 from . import multi_clients, work_loads, StreamBot
+from .fleet import bot_id, client_fleet
+from .scheduler import scheduler
 
 
 async def initialize_clients():
     multi_clients[0] = StreamBot
     work_loads[0] = 0
-    all_tokens = TokenParser().parse_from_env()
-    if not all_tokens:
+    scheduler.set_home_dc(0, await StreamBot.storage.dc_id())
+    await client_fleet.start()
+    if not client_fleet.members:
         print("No additional clients found, using default client")
-        return
-    
-    async def start_client(client_id, token):
-        try:
-            print(f"Starting - Client {client_id}")
-            if client_id == len(all_tokens):
-                await asyncio.sleep(2)
-                print("This will take some time, please wait...")
-            client = await Client(
-                name=str(client_id),
-                api_id=API_ID,
-                api_hash=API_HASH,
-                bot_token=token,
-                sleep_threshold=SLEEP_THRESHOLD,
-                no_updates=True,
-                in_memory=True
-            ).start()
-            work_loads[client_id] = 0
-            return client_id, client
-        except Exception:
-            logging.error(f"Failed starting Client - {client_id} Error:", exc_info=True)
-    
-    clients = await asyncio.gather(*[start_client(i, token) for i, token in all_tokens.items()])
-    multi_clients.update(dict(clients))
-    if len(multi_clients) != 1:
-        MULTI_CLIENT = True
+    elif len(multi_clients) != 1:
         print("Multi-Client Mode Enabled")
     else:
         print("No additional clients were initialized, using default client")
+
+
+async def initialize_worker_clients(worker: int, workers: int):
+    """
+    Starts the clients of one stream worker process: a session of the main bot that receives no updates,
+    as client 0, plus the MULTI_TOKEN clients whose bot id falls to this worker, so no token is logged in
+    by two workers.
+    """
+    client = await Client(
+        name=f"worker{worker}-0",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN,
+        sleep_threshold=SLEEP_THRESHOLD,
+        no_updates=True,
+        in_memory=True
+    ).start()
+    multi_clients[0] = client
+    work_loads[0] = 0
+    scheduler.set_home_dc(0, await client.storage.dc_id())
+    StreamBot.username = client.me.username
+    await client_fleet.start(lambda token: bot_id(token) % workers == worker, f"worker{worker}-")
+    logging.info(f"Stream worker {worker} started clients {sorted(multi_clients)}")
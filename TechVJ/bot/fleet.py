@@ -0,0 +1,323 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+from pyrogram import Client
+from pyrogram.errors import AccessTokenExpired, AccessTokenInvalid, FloodWait, Unauthorized
+from config import (
+    API_HASH, API_ID, SLEEP_THRESHOLD, MULTI_TOKEN_FILE, CLIENT_PROBE_INTERVAL, CLIENT_PROBE_FAILURES,
+    CLIENT_RETRY_DELAY, CLIENT_DRAIN_TIMEOUT, MEDIA_SESSION_PREWARM,
+)
+from TechVJ.utils.config_parser import TokenParser
+from . import multi_clients, work_loads
+from .scheduler import scheduler
+from .session_pool import session_pool
+
+TICK = 5
+PROBE_TIMEOUT = 15
+MAX_RETRY_DELAY = 1800
+DEAD_TOKEN_ERRORS = (AccessTokenInvalid, AccessTokenExpired, Unauthorized)
+
+
+def bot_id(token: str) -> int:
+    prefix = token.split(":", 1)[0]
+    return int(prefix) if prefix.isdigit() else 0
+
+
+class Member:
+    __slots__ = ("index", "token", "client", "state", "failures", "probe_failures", "retry_at", "probe_at", "error")
+
+    def __init__(self, index: int, token: str):
+        self.index = index
+        self.token = token
+        self.client: Optional[Client] = None
+        self.state = "stopped"
+        self.failures = 0
+        self.probe_failures = 0
+        self.retry_at = 0.0
+        self.probe_at = 0.0
+        self.error = ""
+
+
+class ClientFleet:
+    def __init__(self, token_file: str = MULTI_TOKEN_FILE, probe_interval: int = CLIENT_PROBE_INTERVAL,
+                 probe_failures: int = CLIENT_PROBE_FAILURES, retry_delay: int = CLIENT_RETRY_DELAY,
+                 drain_timeout: int = CLIENT_DRAIN_TIMEOUT):
+        """
+        Keeps the MULTI_TOKEN stream clients running without restarting the server.
+
+        Tokens come from the MULTI_TOKEN variables plus the token file, which is reread when it changes.
+        Every running client is probed with get_me; one that keeps failing is drained from the balancer,
+        stopped once its streams finish and started again with exponential backoff. Tokens that Telegram
+        rejects as invalid, revoked or banned are retired until the token list changes.
+
+        Attributes:
+            token_file: optional file with one bot token per line.
+            probe_interval: seconds between health probes of each client.
+            probe_failures: failed probes in a row before a client is drained and restarted.
+            retry_delay: first delay in seconds before starting a failed client again.
+            drain_timeout: seconds a draining client may keep serving streams before it is stopped anyway.
+            members: clients by index in multi_clients.
+        """
+        self.token_file = token_file
+        self.probe_interval = probe_interval
+        self.probe_failures = probe_failures
+        self.retry_delay = retry_delay
+        self.drain_timeout = drain_timeout
+        self.owns: Callable[[str], bool] = lambda token: True
+        self.name_prefix = ""
+        self.members: Dict[int, Member] = {}
+        self.indexes: Dict[str, int] = {}
+        self.env_tokens: Dict[int, str] = TokenParser().parse_from_env()
+        self.file_tokens: List[str] = []
+        self.file_mtime: Optional[float] = None
+        self.tasks = set()
+        self.runner: Optional[asyncio.Task] = None
+
+    def read_token_file(self) -> bool:
+        """Rereads the token file if it changed, returning whether it did."""
+        if not self.token_file:
+            return False
+        try:
+            mtime = os.stat(self.token_file).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.file_mtime:
+            return False
+        tokens = []
+        if mtime is not None:
+            try:
+                with open(self.token_file) as f:
+                    tokens = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+            except OSError:
+                logging.warning(f"Failed to read stream client tokens from {self.token_file}", exc_info=True)
+                return False
+        self.file_mtime = mtime
+        self.file_tokens = tokens
+        return True
+
+    def wanted(self) -> Dict[str, int]:
+        """Returns the tokens this process should run, with their stable index in multi_clients."""
+        tokens = list(self.env_tokens.values()) + [token for token in self.file_tokens if token not in self.env_tokens.values()]
+        for env_index, token in self.env_tokens.items():
+            self.indexes.setdefault(token, env_index)
+        for token in tokens:
+            if token not in self.indexes:
+                self.indexes[token] = max([len(self.env_tokens), *self.indexes.values()]) + 1
+        return {token: self.indexes[token] for token in tokens if self.owns(token)}
+
+    async def start(self, owns: Optional[Callable[[str], bool]] = None, name_prefix: str = "") -> None:
+        """Starts the clients of every token and keeps reconciling them in the background."""
+        if owns is not None:
+            self.owns = owns
+        self.name_prefix = name_prefix
+        self.read_token_file()
+        await self.reconcile()
+        if self.runner is None:
+            self.runner = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(TICK)
+            try:
+                self.read_token_file()
+                await self.reconcile()
+            except Exception:
+                logging.error("Stream client fleet reconcile failed", exc_info=True)
+
+    async def reload(self) -> None:
+        """Applies token file changes right away instead of on the next tick, if this process runs the fleet."""
+        if self.runner is not None and self.read_token_file():
+            try:
+                await self.reconcile()
+            except Exception:
+                logging.error("Stream client fleet reconcile failed", exc_info=True)
+
+    async def reconcile(self) -> None:
+        now = time.monotonic()
+        wanted = self.wanted()
+        jobs = []
+        for token, index in wanted.items():
+            member = self.members.get(index)
+            if member is None:
+                member = self.members[index] = Member(index, token)
+            if member.state == "stopped" and member.retry_at <= now:
+                jobs.append(self.launch(member))
+            elif member.state == "healthy" and member.probe_at <= now:
+                jobs.append(self.probe(member))
+        for index, member in list(self.members.items()):
+            if member.token not in wanted:
+                if member.state in ("healthy", "starting"):
+                    self.drain(member, "removed from the token list")
+                if member.state in ("stopped", "dead"):
+                    self.members.pop(index)
+        for index in [index for index in work_loads if index not in multi_clients]:
+            self.release(index)
+        if jobs:
+            await asyncio.gather(*jobs)
+
+    async def launch(self, member: Member) -> None:
+        member.state = "starting"
+        try:
+            client = await Client(
+                name=f"{self.name_prefix}{member.index}",
+                api_id=API_ID,
+                api_hash=API_HASH,
+                bot_token=member.token,
+                sleep_threshold=SLEEP_THRESHOLD,
+                no_updates=True,
+                in_memory=True
+            ).start()
+            home_dc = await client.storage.dc_id()
+        except DEAD_TOKEN_ERRORS as e:
+            self.retire(member, e)
+            return
+        except Exception as e:
+            self.failed(member, e)
+            return
+        if member.state != "starting":
+            member.client = client
+            member.state = "draining"
+            self.tasks.add(asyncio.create_task(self.stop(member, 0)))
+            return
+        member.client = client
+        member.state = "healthy"
+        member.probe_failures = 0
+        member.error = ""
+        member.probe_at = time.monotonic() + self.probe_interval
+        work_loads.setdefault(member.index, 0)
+        scheduler.set_home_dc(member.index, home_dc)
+        multi_clients[member.index] = client
+        logging.info(f"Started stream client {member.index} (@{client.me.username})")
+        # Clients of the first reconcile are pre-warmed with the rest at startup
+        if MEDIA_SESSION_PREWARM and self.runner is not None:
+            task = asyncio.create_task(session_pool.prewarm([client]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def probe(self, member: Member) -> None:
+        member.probe_at = time.monotonic() + self.probe_interval
+        try:
+            await asyncio.wait_for(member.client.get_me(), PROBE_TIMEOUT)
+        except FloodWait:
+            return
+        except DEAD_TOKEN_ERRORS as e:
+            self.drain(member, f"token rejected: {e}")
+            self.retire(member, e)
+            return
+        except Exception as e:
+            member.probe_failures += 1
+            member.error = repr(e)
+            logging.warning(f"Health probe {member.probe_failures}/{self.probe_failures} of stream client {member.index} failed: {e!r}")
+            if member.probe_failures >= self.probe_failures:
+                self.drain(member, "health probes failing")
+                member.failures += 1
+                member.retry_at = time.monotonic() + self.backoff(member)
+            return
+        member.probe_failures = 0
+        member.failures = 0
+
+    def drain(self, member: Member, reason: str) -> None:
+        """Takes a client out of the balancer and stops it once its streams are done."""
+        if member.state not in ("healthy", "starting"):
+            return
+        logging.warning(f"Draining stream client {member.index}: {reason}")
+        if member.client is not None and multi_clients.get(member.index) is member.client:
+            multi_clients.pop(member.index)
+        member.state = "draining"
+        if member.client is not None:
+            self.tasks.add(asyncio.create_task(self.stop(member, self.drain_timeout)))
+
+    async def stop(self, member: Member, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while work_loads.get(member.index, 0) > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(1)
+        client, member.client = member.client, None
+        self.release(member.index)
+        session_pool.forget(client)
+        try:
+            await client.stop()
+        except Exception:
+            logging.debug(f"Error while stopping stream client {member.index}", exc_info=True)
+        if member.state == "draining":
+            member.state = "dead" if member.retry_at == float("inf") else "stopped"
+        self.tasks.discard(asyncio.current_task())
+        logging.info(f"Stopped stream client {member.index}")
+
+    @staticmethod
+    def release(index: int) -> None:
+        """Drops the load bookkeeping of a client index once it is out of the balancer and no stream holds it."""
+        if index not in multi_clients and work_loads.get(index, 0) <= 0:
+            work_loads.pop(index, None)
+            scheduler.remove(index)
+
+    def backoff(self, member: Member) -> float:
+        return min(MAX_RETRY_DELAY, self.retry_delay * 2 ** max(0, member.failures - 1))
+
+    def failed(self, member: Member, error: Exception) -> None:
+        member.failures += 1
+        member.error = repr(error)
+        member.state = "stopped"
+        delay = self.backoff(member)
+        member.retry_at = time.monotonic() + delay
+        logging.error(f"Failed starting stream client {member.index}, retrying in {delay}s: {error!r}")
+
+    def retire(self, member: Member, error: Exception) -> None:
+        """Stops retrying a token Telegram no longer accepts; it is tried again only if it is removed and added back."""
+        member.error = repr(error)
+        member.retry_at = float("inf")
+        if member.client is None:
+            member.state = "dead"
+        logging.error(f"Stream client {member.index} token was rejected and is retired: {error!r}")
+
+    def write_tokens(self, tokens: List[str]) -> None:
+        """Atomically replaces the tokens in the token file, keeping its comment lines."""
+        comments = []
+        if os.path.exists(self.token_file):
+            with open(self.token_file) as f:
+                comments = [line.rstrip("\n") for line in f if line.lstrip().startswith("#")]
+        if os.path.dirname(self.token_file):
+            os.makedirs(os.path.dirname(self.token_file), exist_ok=True)
+        tmp = f"{self.token_file}.tmp"
+        with open(tmp, "w") as f:
+            f.write("".join(f"{line}\n" for line in comments + tokens))
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.token_file)
+
+    async def add_token(self, token: str) -> bool:
+        """Adds a token to the token file and starts its client, returning False if it is already configured."""
+        self.read_token_file()
+        if token in self.file_tokens or token in self.env_tokens.values():
+            return False
+        self.write_tokens(self.file_tokens + [token])
+        await self.reload()
+        return True
+
+    async def remove_token(self, bot: int) -> Optional[str]:
+        """Removes the tokens of a bot id from the token file; returns where the token was configured, if anywhere."""
+        self.read_token_file()
+        if any(bot_id(token) == bot for token in self.env_tokens.values()):
+            return "env"
+        tokens = [token for token in self.file_tokens if bot_id(token) != bot]
+        if len(tokens) == len(self.file_tokens):
+            return None
+        self.write_tokens(tokens)
+        await self.reload()
+        return "file"
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        now = time.monotonic()
+        return {
+            str(index): {
+                "bot_id": bot_id(member.token),
+                "state": member.state,
+                "failures": member.failures,
+                "retry_in": max(0, round(member.retry_at - now)) if member.state == "stopped" else 0,
+                "error": member.error,
+            }
+            for index, member in sorted(self.members.items())
+        }
+
+
+client_fleet = ClientFleet()
@@ -0,0 +1,105 @@
+import time
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_LATENCY = 0.25
+BYTES_UNIT = 1024 * 1024
+REMOTE_DC_PENALTY = 1.5
+FLOOD_PENALTY = 1e9
+
+
+class ClientStats:
+    __slots__ = ("streams", "bytes_in_flight", "requests_in_flight", "latency", "error_rate", "flood_until", "home_dc")
+
+    def __init__(self, home_dc: Optional[int] = None):
+        self.streams = 0
+        self.bytes_in_flight = 0
+        self.requests_in_flight = 0
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.flood_until = 0.0
+        self.home_dc = home_dc
+
+
+class Scheduler:
+    def __init__(self):
+        """
+        Scores stream clients so each download goes to the one expected to serve it fastest.
+
+        A client's score grows with the bytes it still has to deliver, its moving average GetFile latency
+        and its recent error rate; clients in FloodWait are avoided and clients homed in the file's DC are preferred.
+        Lower is better.
+        """
+        self.stats: Dict[int, ClientStats] = {}
+
+    def get(self, index: int) -> ClientStats:
+        if index not in self.stats:
+            self.stats[index] = ClientStats()
+        return self.stats[index]
+
+    def set_home_dc(self, index: int, dc_id: int) -> None:
+        self.get(index).home_dc = dc_id
+
+    def remove(self, index: int) -> None:
+        self.stats.pop(index, None)
+
+    def score(self, index: int, dc_id: Optional[int] = None) -> float:
+        stats = self.get(index)
+        latency = stats.latency if stats.latency is not None else DEFAULT_LATENCY
+        score = latency * (1 + stats.bytes_in_flight / BYTES_UNIT) * (1 + 4 * stats.error_rate)
+        if dc_id and stats.home_dc and dc_id != stats.home_dc:
+            score *= REMOTE_DC_PENALTY
+        wait = stats.flood_until - time.monotonic()
+        if wait > 0:
+            score += FLOOD_PENALTY + wait
+        return score
+
+    def rank(self, indexes: Iterable[int], dc_id: Optional[int] = None) -> List[int]:
+        """Returns the client indexes from best to worst."""
+        return sorted(indexes, key=lambda index: self.score(index, dc_id))
+
+    def pick(self, indexes: Iterable[int], dc_id: Optional[int] = None) -> int:
+        return min(indexes, key=lambda index: self.score(index, dc_id))
+
+    def stream_started(self, index: int, length: int) -> None:
+        stats = self.get(index)
+        stats.streams += 1
+        stats.bytes_in_flight += length
+
+    def stream_progress(self, index: int, length: int) -> None:
+        stats = self.get(index)
+        stats.bytes_in_flight = max(0, stats.bytes_in_flight - length)
+
+    def stream_finished(self, index: int, remaining: int) -> None:
+        stats = self.get(index)
+        stats.streams = max(0, stats.streams - 1)
+        stats.bytes_in_flight = max(0, stats.bytes_in_flight - remaining)
+
+    def request_started(self, index: int) -> None:
+        self.get(index).requests_in_flight += 1
+
+    def request_finished(self, index: int, latency: Optional[float] = None, error: bool = False) -> None:
+        stats = self.get(index)
+        stats.requests_in_flight = max(0, stats.requests_in_flight - 1)
+        if latency is not None:
+            stats.latency = latency if stats.latency is None else stats.latency * 0.8 + latency * 0.2
+        stats.error_rate = stats.error_rate * 0.9 + (0.1 if error else 0.0)
+
+    def flood_wait(self, index: int, seconds: float) -> None:
+        stats = self.get(index)
+        stats.flood_until = max(stats.flood_until, time.monotonic() + seconds)
+
+    def snapshot(self, index: int) -> Dict[str, float]:
+        stats = self.get(index)
+        return {
+            "streams": stats.streams,
+            "bytes_in_flight": stats.bytes_in_flight,
+            "requests_in_flight": stats.requests_in_flight,
+            "latency_ms": round((stats.latency or 0) * 1000, 1),
+            "error_rate": round(stats.error_rate, 3),
+            "flood_wait": max(0, round(stats.flood_until - time.monotonic())),
+            "dc": stats.home_dc,
+            "score": round(self.score(index), 4),
+        }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,244 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+from pyrogram import Client, raw
+from pyrogram.session import Session, Auth
+from pyrogram.errors import AuthBytesInvalid
+from config import MEDIA_SESSION_HEALTH, MEDIA_SESSION_IDLE
+from .auth_store import auth_store
+
+MEDIA_DCS = (1, 2, 3, 4, 5)
+RESUME_TIMEOUT = 15
+
+
+class DCStats:
+    __slots__ = ("sessions", "created", "resumed", "reconnects", "failures", "reaped", "invalidated", "ping")
+
+    def __init__(self):
+        self.sessions = 0
+        self.created = 0
+        self.resumed = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.reaped = 0
+        self.invalidated = 0
+        self.ping = 0.0
+
+
+class MediaSessionPool:
+    def __init__(self, health_interval: int = MEDIA_SESSION_HEALTH, idle_timeout: int = MEDIA_SESSION_IDLE):
+        """
+        Owns the media sessions of every client: creates them once per (client, DC), pings them,
+        restarts dead ones in the background and stops the ones left idle for too long.
+
+        Foreign DC sessions are opened with the auth key saved by a previous run when there is one,
+        and the key is forgotten as soon as Telegram reports it unregistered.
+
+        Attributes:
+            health_interval: seconds between health checks.
+            idle_timeout: seconds without use after which a foreign DC session is stopped, 0 to keep them forever.
+            dc_stats: per-DC counters shown on the status route.
+        """
+        self.health_interval = health_interval
+        self.idle_timeout = idle_timeout
+        self.locks: Dict[Tuple[Client, int], asyncio.Lock] = {}
+        self.last_used: Dict[Tuple[Client, int], float] = {}
+        self.home_dcs: Dict[Client, int] = {}
+        self.dc_stats: Dict[int, DCStats] = {}
+
+    def stats_for(self, dc_id: int) -> DCStats:
+        if dc_id not in self.dc_stats:
+            self.dc_stats[dc_id] = DCStats()
+        return self.dc_stats[dc_id]
+
+    async def get(self, client: Client, dc_id: int) -> Session:
+        """Returns the media session of a client for a DC, creating it on first use."""
+        key = (client, dc_id)
+        self.touch(client, dc_id)
+        media_session = client.media_sessions.get(dc_id)
+        if media_session:
+            logging.debug(f"Using cached media session for DC {dc_id}")
+            return media_session
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            media_session = client.media_sessions.get(dc_id)
+            if not media_session:
+                media_session = await self.create(client, dc_id)
+                client.media_sessions[dc_id] = media_session
+            return media_session
+
+    def touch(self, client: Client, dc_id: int) -> None:
+        """Marks a session as in use, so a long download keeps it from being reaped as idle."""
+        self.last_used[(client, dc_id)] = time.monotonic()
+
+    async def create(self, client: Client, dc_id: int) -> Session:
+        stats = self.stats_for(dc_id)
+        try:
+            home_dc = await client.storage.dc_id()
+            self.home_dcs[client] = home_dc
+            if dc_id != home_dc:
+                media_session = await self.resume(client, dc_id)
+                if media_session:
+                    stats.resumed += 1
+                    stats.sessions += 1
+                    return media_session
+                test_mode = await client.storage.test_mode()
+                auth_key = await Auth(client, dc_id, test_mode).create()
+                media_session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+                await media_session.start()
+                for _ in range(6):
+                    exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                    try:
+                        await media_session.send(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
+                        break
+                    except AuthBytesInvalid:
+                        logging.debug(f"Invalid authorization bytes for DC {dc_id}")
+                        continue
+                else:
+                    await media_session.stop()
+                    raise AuthBytesInvalid
+                await auth_store.put(await client.storage.user_id(), dc_id, test_mode, auth_key)
+            else:
+                media_session = Session(client, dc_id, await client.storage.auth_key(), await client.storage.test_mode(), is_media=True)
+                await media_session.start()
+        except Exception:
+            stats.failures += 1
+            raise
+        stats.created += 1
+        stats.sessions += 1
+        logging.debug(f"Created media session for DC {dc_id}")
+        return media_session
+
+    async def resume(self, client: Client, dc_id: int) -> Optional[Session]:
+        """Starts a media session with the stored auth key of a foreign DC, dropping the key if it no longer works."""
+        if not auth_store.enabled:
+            return None
+        user_id = await client.storage.user_id()
+        test_mode = await client.storage.test_mode()
+        auth_key = await auth_store.get(user_id, dc_id, test_mode)
+        if auth_key is None:
+            return None
+        media_session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+        try:
+            await asyncio.wait_for(media_session.start(), RESUME_TIMEOUT)
+        except Exception:
+            logging.info(f"Stored media auth key for DC {dc_id} of {client.name} was rejected, authorizing again")
+            await auth_store.delete(user_id, dc_id, test_mode)
+            try:
+                await media_session.stop()
+            except Exception:
+                logging.debug(f"Error while stopping rejected media session for DC {dc_id}", exc_info=True)
+            return None
+        logging.debug(f"Resumed media session for DC {dc_id} with a stored auth key")
+        return media_session
+
+    async def invalidate(self, client: Client, media_session: Session) -> None:
+        """Drops a session whose auth key Telegram no longer accepts, so that the next use authorizes again."""
+        dc_id = media_session.dc_id
+        stats = self.stats_for(dc_id)
+        async with self.locks.setdefault((client, dc_id), asyncio.Lock()):
+            if client.media_sessions.get(dc_id) is not media_session:
+                return
+            client.media_sessions.pop(dc_id)
+            stats.sessions -= 1
+            stats.invalidated += 1
+        logging.warning(f"Auth key of the media session for DC {dc_id} of {client.name} was revoked, dropping it")
+        await auth_store.delete(await client.storage.user_id(), dc_id, await client.storage.test_mode())
+        try:
+            await media_session.stop()
+        except Exception:
+            logging.debug(f"Error while stopping revoked media session for DC {dc_id}", exc_info=True)
+
+    def forget(self, client: Client) -> None:
+        """Drops the bookkeeping of a client that is being stopped; stopping the client closes its sessions."""
+        for dc_id in client.media_sessions:
+            self.stats_for(dc_id).sessions -= 1
+        for key in [key for key in self.last_used if key[0] is client]:
+            self.last_used.pop(key)
+        for key in [key for key in self.locks if key[0] is client]:
+            self.locks.pop(key)
+        self.home_dcs.pop(client, None)
+
+    async def prewarm(self, clients: Iterable[Client], concurrency: int = 4) -> None:
+        """Creates the media sessions of all clients for every DC ahead of the first viewer."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(client: Client, dc_id: int):
+            async with semaphore:
+                try:
+                    await self.get(client, dc_id)
+                except Exception:
+                    logging.warning(f"Failed to pre-warm media session for DC {dc_id} of {client.name}", exc_info=True)
+
+        await asyncio.gather(*[warm(client, dc_id) for client in clients for dc_id in MEDIA_DCS])
+        logging.info(f"Pre-warmed media sessions: {self.stats()}")
+
+    async def check(self, client: Client, dc_id: int, media_session: Session) -> None:
+        """Pings a session and restarts it, or drops it for a clean rebuild, when it does not answer."""
+        stats = self.stats_for(dc_id)
+        start = time.monotonic()
+        try:
+            await media_session.send(raw.functions.Ping(ping_id=0), timeout=10)
+            stats.ping = time.monotonic() - start
+            return
+        except Exception:
+            logging.warning(f"Media session for DC {dc_id} of {client.name} is not responding, reconnecting")
+        stats.reconnects += 1
+        key = (client, dc_id)
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            try:
+                await media_session.restart()
+            except Exception:
+                stats.failures += 1
+                stats.sessions -= 1
+                client.media_sessions.pop(dc_id, None)
+                logging.warning(f"Reconnect failed for DC {dc_id} of {client.name}, it will be recreated on next use")
+
+    async def reap(self, client: Client, dc_id: int, media_session: Session) -> None:
+        stats = self.stats_for(dc_id)
+        async with self.locks.setdefault((client, dc_id), asyncio.Lock()):
+            client.media_sessions.pop(dc_id, None)
+            self.last_used.pop((client, dc_id), None)
+            stats.sessions -= 1
+            stats.reaped += 1
+        try:
+            await media_session.stop()
+        except Exception:
+            logging.debug(f"Error while stopping idle media session for DC {dc_id}", exc_info=True)
+        logging.debug(f"Reaped idle media session for DC {dc_id} of {client.name}")
+
+    async def maintain(self) -> None:
+        """Periodically health-checks every media session and reaps idle foreign DC sessions."""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            now = time.monotonic()
+            jobs = []
+            for (client, dc_id), last_used in list(self.last_used.items()):
+                media_session = client.media_sessions.get(dc_id)
+                if not media_session:
+                    continue
+                idle = now - last_used
+                if self.idle_timeout and idle > self.idle_timeout and dc_id != self.home_dcs.get(client):
+                    jobs.append(self.reap(client, dc_id, media_session))
+                else:
+                    jobs.append(self.check(client, dc_id, media_session))
+            await asyncio.gather(*jobs, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            f"dc{dc_id}": {
+                "sessions": stats.sessions,
+                "created": stats.created,
+                "resumed": stats.resumed,
+                "reconnects": stats.reconnects,
+                "failures": stats.failures,
+                "reaped": stats.reaped,
+                "invalidated": stats.invalidated,
+                "ping_ms": round(stats.ping * 1000, 1),
+            }
+            for dc_id, stats in sorted(self.dc_stats.items())
+        }
+
+
+session_pool = MediaSessionPool()
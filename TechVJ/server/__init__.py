@@ -1,8 +1,8 @@
 from aiohttp import web
-from .stream_routes import routes
+from .stream_routes import routes, trace_requests
 
 
 async def web_server():
-    web_app = web.Application(client_max_size=30000000)
+    web_app = web.Application(client_max_size=30000000, middlewares=[trace_requests])
     web_app.add_routes(routes)
     return web_app
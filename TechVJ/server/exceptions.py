@@ -3,4 +3,10 @@ class InvalidHash(Exception):
     message = "Invalid hash"
 
 class FIleNotFound(Exception):
-    message = "File not found"
\ No newline at end of file
+    message = "File not found"
+
+class RangeNotSatisfiable(Exception):
+    message = "416: Range not satisfiable"
+
+class LinkExpired(Exception):
+    message = "Link expired"
@@ -0,0 +1,43 @@
+import time
+import asyncio
+from typing import BinaryIO, List, Optional, Tuple
+from aiohttp import web
+from TechVJ.utils.metrics import bytes_sent, ttfb
+
+
+class ChunkFileResponse(web.StreamResponse):
+    def __init__(self, parts: List[Tuple[BinaryIO, int, int]], status: int = 200, headers=None, started: Optional[float] = None):
+        """
+        A response that sends slices of already open files straight from the page cache.
+
+        Attributes:
+            parts: (file object, offset, count) tuples written back to back.
+            started: monotonic arrival time of the request, to report time to first byte.
+        """
+        super().__init__(status=status, headers=headers)
+        self._parts = parts
+        self._started = started
+
+    async def prepare(self, request: web.BaseRequest):
+        try:
+            writer = await super().prepare(request)
+            if request.method == "HEAD":
+                return writer
+            loop = asyncio.get_running_loop()
+            if self._started is not None:
+                ttfb.observe(time.monotonic() - self._started)
+            for fobj, offset, count in self._parts:
+                transport = request.transport
+                if transport is None:
+                    raise ConnectionResetError("Connection lost")
+                try:
+                    await loop.sendfile(transport, fobj, offset, count)
+                except NotImplementedError:
+                    fobj.seek(offset)
+                    await writer.write(await asyncio.to_thread(fobj.read, count))
+                bytes_sent.inc("disk", amount=count)
+            await super().write_eof()
+            return writer
+        finally:
+            for fobj, _, _ in self._parts:
+                fobj.close()
@@ -1,22 +1,72 @@
 import re
 import time
-import math
 import logging
 import secrets
 import mimetypes
+import urllib.parse
+import aiohttp
+from contextlib import aclosing
 from aiohttp import web
 from aiohttp.http_exceptions import BadStatusLine
 from TechVJ.bot import multi_clients, work_loads, StreamBot
-from TechVJ.server.exceptions import FIleNotFound, InvalidHash
+from TechVJ.bot.scheduler import scheduler
+from TechVJ.bot.session_pool import session_pool
+from TechVJ.bot.fleet import client_fleet
+from TechVJ.server.exceptions import FIleNotFound, InvalidHash, LinkExpired, RangeNotSatisfiable
 from TechVJ import StartTime, __version__
 from ..utils.time_format import get_readable_time
 from ..utils.custom_dl import ByteStreamer
-from TechVJ.utils.render_template import render_page
-from config import MULTI_CLIENT
+from ..utils.file_cache import file_cache
+from ..utils.file_properties import FileMeta
+from ..utils.media_index import index_cache
+from ..utils.range_planner import parse_range, plan_parts
+from ..utils.chunk_cache import CHUNK_SIZE, disk_cache, memory_cache
+from ..utils.signed_url import verify
+from ..utils.metrics import registry, bytes_sent, range_size, ttfb
+from ..utils.tracing import current_trace, tracer
+from ..utils.cluster import cluster
+from .responses import ChunkFileResponse
+from TechVJ.utils.render_template import Page, render_page
+from config import MULTI_CLIENT, STRIPED_STREAM, STRIPE_WIDTH, CLUSTER_PROXY
 
 
 routes = web.RouteTableDef()
 
+UNTRACED_PATHS = ("/metrics", "/debug/requests")
+
+@web.middleware
+async def trace_requests(request: web.Request, handler):
+    """
+    Opens a trace per request; a streamed body keeps it open until the last byte is sent.
+
+    Traces are named after the route pattern rather than the path, so link tokens and hashes never reach
+    /debug/requests or the trace file.
+    """
+    if request.path in UNTRACED_PATHS:
+        current_trace.set(None)
+        return await handler(request)
+    resource = request.match_info.route.resource
+    trace = tracer.start(
+        f"{request.method} {resource.canonical if resource else 'unmatched'}",
+        method=request.method,
+        range=request.headers.get("Range", ""),
+    )
+    try:
+        response = await handler(request)
+        if trace:
+            trace.root.attributes["status"] = response.status
+        return response
+    except web.HTTPException as e:
+        if trace:
+            trace.root.attributes["status"] = e.status
+        raise
+    except BaseException as e:
+        if trace:
+            trace.root.error = type(e).__name__
+        raise
+    finally:
+        tracer.release(trace)
+
 @routes.get("/", allow_head=True)
 async def root_route_handler(_):
     return web.json_response(
@@ -31,11 +81,111 @@ async def root_route_handler(_):
                     sorted(work_loads.items(), key=lambda x: x[1], reverse=True)
                 )
             ),
+            "clients": dict(
+                ("bot" + str(index + 1), scheduler.snapshot(index))
+                for index in scheduler.rank(multi_clients)
+            ),
+            "fleet": client_fleet.stats(),
+            "media_sessions": session_pool.stats(),
+            "file_cache": file_cache.stats(),
+            "memory_cache": memory_cache.stats(),
+            "index_cache": index_cache.stats(),
             "version": __version__,
         }
     )
 
 
+@registry.sample("stream_uptime_seconds", "gauge", "Seconds since the server started.")
+def sample_uptime():
+    yield (), time.time() - StartTime
+
+@registry.sample("stream_active", "gauge", "Streams being served per client.", ("client",))
+def sample_active_streams():
+    for index, load in sorted(work_loads.items()):
+        yield (str(index),), load
+
+@registry.sample("stream_clients", "gauge", "MULTI_TOKEN stream clients by state.", ("state",))
+def sample_stream_clients():
+    states = dict.fromkeys(("starting", "healthy", "draining", "stopped", "dead"), 0)
+    for member in client_fleet.members.values():
+        states[member.state] += 1
+    for state, count in states.items():
+        yield (state,), count
+
+@registry.sample("getfile_in_flight", "gauge", "GetFile calls in flight per client.", ("client",))
+def sample_getfile_in_flight():
+    for index in sorted(multi_clients):
+        yield (str(index),), scheduler.get(index).requests_in_flight
+
+@registry.sample("cache_requests_total", "counter", "Cache lookups by result.", ("cache", "result"))
+def sample_cache_requests():
+    for name, stats in (("memory", memory_cache.stats()), ("file_meta", file_cache.stats())):
+        yield (name, "hit"), stats["hits"]
+        yield (name, "miss"), stats["misses"]
+    yield ("index", "hit"), index_cache.stats()["hits"]
+
+@registry.sample("media_sessions", "gauge", "Open media sessions per DC.", ("dc",))
+def sample_media_sessions():
+    for dc_id, stats in sorted(session_pool.dc_stats.items()):
+        yield (str(dc_id),), stats.sessions
+
+@registry.sample("media_session_events_total", "counter", "Media session lifecycle events per DC.", ("dc", "event"))
+def sample_media_session_events():
+    for dc_id, stats in sorted(session_pool.dc_stats.items()):
+        for event in ("created", "resumed", "reconnects", "failures", "reaped", "invalidated"):
+            yield (str(dc_id), event), getattr(stats, event)
+
+@routes.get("/metrics")
+async def metrics_handler(_):
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8", headers={"Cache-Control": "no-store"})
+
+
+@routes.get("/debug/requests")
+async def debug_requests_handler(request: web.Request):
+    try:
+        limit = int(request.rel_url.query.get("limit", "20"))
+    except ValueError:
+        raise web.HTTPBadRequest(text="limit must be an integer")
+    return web.json_response({"enabled": tracer.enabled, "requests": tracer.slowest(limit)})
+
+
+@routes.get(r"/watch/s/{token:[A-Za-z0-9_-]+}{name:(/.*)?}", allow_head=True)
+async def signed_watch_handler(request: web.Request):
+    try:
+        token = request.match_info["token"]
+        file_name = request.match_info["name"].lstrip("/")
+        link = verify(token, file_name)
+        file_data = link.to_meta(file_name)
+        src = urllib.parse.urljoin(cluster.url_for(link.message_id), f"s/{token}/{urllib.parse.quote(file_name, safe='')}")
+        return page_response(request, await render_page(link.message_id, link.unique_id[:6], src, file_data))
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except LinkExpired as e:
+        raise web.HTTPGone(text=e.message)
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logging.critical(e.with_traceback(None))
+        raise web.HTTPInternalServerError(text=str(e))
+
+@routes.get(r"/s/{token:[A-Za-z0-9_-]+}{name:(/.*)?}", allow_head=True)
+async def signed_stream_handler(request: web.Request):
+    try:
+        file_name = request.match_info["name"].lstrip("/")
+        link = verify(request.match_info["token"], file_name)
+        return await media_streamer(request, link.message_id, link.unique_id[:6], link.to_meta(file_name))
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except LinkExpired as e:
+        raise web.HTTPGone(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logging.critical(e.with_traceback(None))
+        raise web.HTTPInternalServerError(text=str(e))
+
 @routes.get(r"/watch/{path:\S+}", allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -47,7 +197,7 @@ async def stream_handler(request: web.Request):
         else:
             id = int(re.search(r"(\d+)(?:\/\S+)?", path).group(1))
             secure_hash = request.rel_url.query.get("hash")
-        return web.Response(text=await render_page(id, secure_hash), content_type='text/html')
+        return page_response(request, await render_page(id, secure_hash))
     except InvalidHash as e:
         raise web.HTTPForbidden(text=e.message)
     except FIleNotFound as e:
@@ -82,60 +232,183 @@ async def stream_handler(request: web.Request):
 
 class_cache = {}
 
-async def media_streamer(request: web.Request, id: int, secure_hash: str):
-    range_header = request.headers.get("Range", 0)
-    
-    index = min(work_loads, key=work_loads.get)
+def get_streamer(index: int) -> ByteStreamer:
+    """Returns the cached ByteStreamer of a client, creating it on first use."""
     faster_client = multi_clients[index]
-    
-    if MULTI_CLIENT:
-        logging.info(f"Client {index} is now serving {request.remote}")
-
     if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
         logging.debug(f"Using cached ByteStreamer object for client {index}")
+        return class_cache[faster_client]
+    logging.debug(f"Creating new ByteStreamer object for client {index}")
+    for client in [client for client in class_cache if client not in multi_clients.values()]:
+        del class_cache[client]
+    tg_connect = ByteStreamer(faster_client, index)
+    class_cache[faster_client] = tg_connect
+    return tg_connect
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an entity tag."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+async def resolve_file(tg_connect: ByteStreamer, file_id: FileMeta, id: int) -> FileMeta:
+    """Completes the metadata of a signed link before streaming, checking it still names the same file."""
+    if file_id.file_type is not None:
+        return file_id
+    with tracer.span("resolve_file", message_id=id):
+        meta = await tg_connect.get_file_properties(id)
+    if meta.unique_id != file_id.unique_id:
+        logging.debug(f"Signed link for message ID {id} no longer matches the stored file")
+        raise FIleNotFound
+    return meta
+
+def page_response(request: web.Request, page: Page) -> web.Response:
+    """Sends the precompressed variant of a rendered page that the client accepts, or 304 if it has it."""
+    coding = page.negotiate(request.headers.get("Accept-Encoding"))
+    etag = page.variant_etag(coding)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers=headers)
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return web.Response(body=page.bodies[coding], content_type="text/html", charset="utf-8", headers=headers)
+
+def metered_body(body, started: float):
+    """Wraps a body generator to report time to first byte and bytes sent, holding the request trace open."""
+    return traced_body(body, started, tracer.hold())
+
+async def traced_body(body, started: float, trace):
+    start_ns = time.time_ns()
+    first = True
+    sent = 0
+    waited = 0.0
+    error = None
+    try:
+        async with aclosing(body) as chunks:
+            async for chunk in chunks:
+                if first:
+                    ttfb.observe(time.monotonic() - started)
+                    tracer.record(trace, "first_byte", start_ns)
+                    first = False
+                bytes_sent.inc("stream", amount=len(chunk))
+                sent += len(chunk)
+                yielded_at = time.monotonic()
+                yield chunk
+                waited += time.monotonic() - yielded_at
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        tracer.record(trace, "send_body", start_ns, error, bytes=sent, client_wait_ms=round(waited * 1000, 3))
+        tracer.release(trace)
+
+CLUSTER_HOP_HEADER = "X-Cluster-Hop"
+PROXY_REQUEST_HEADERS = ("Range", "If-Range", "If-None-Match", "User-Agent")
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "proxy-authenticate", "proxy-authorization"}
+proxy_session: "aiohttp.ClientSession" = None
+
+async def route_to_owner(request: web.Request, owner: str):
+    """
+    Sends a request for a file owned by another cluster node there, by redirect or by proxying it.
+    Returns None if the owner cannot be reached, so the file is served locally instead.
+    """
+    target = urllib.parse.urljoin(owner, request.path_qs.lstrip("/"))
+    if not CLUSTER_PROXY:
+        return web.Response(status=307, headers={"Location": target, "Cache-Control": "no-store"})
+    global proxy_session
+    if proxy_session is None or proxy_session.closed:
+        proxy_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=60), auto_decompress=False)
+    headers = {name: request.headers[name] for name in PROXY_REQUEST_HEADERS if name in request.headers}
+    headers[CLUSTER_HOP_HEADER] = "1"
+    try:
+        upstream = await proxy_session.request(request.method, target, headers=headers, allow_redirects=False)
+    except (aiohttp.ClientError, TimeoutError):
+        logging.warning(f"Cluster node {owner} is unreachable, serving {request.path} locally")
+        return None
+    async with upstream:
+        response = web.StreamResponse(
+            status=upstream.status,
+            headers={name: value for name, value in upstream.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS},
+        )
+        await response.prepare(request)
+        if request.method != "HEAD":
+            async for chunk in upstream.content.iter_any():
+                await response.write(chunk)
+        await response.write_eof()
+        return response
+
+def stream_range(tg_connect: ByteStreamer, file_id, index: int, start: int, end: int, stripe, id: int):
+    """Returns the body generator for one inclusive byte range of the file."""
+    parts = plan_parts(start, end)
+    return tg_connect.yield_file(file_id, index, parts, stripe if len(parts) > 1 else None, id)
+
+async def multipart_body(tg_connect: ByteStreamer, file_id, index: int, ranges, part_heads, tail: bytes, stripe, id: int):
+    """Generator for a multipart/byteranges body, streaming the ranges one after another."""
+    for (start, end), head in zip(ranges, part_heads):
+        yield head
+        async with aclosing(stream_range(tg_connect, file_id, index, start, end, stripe, id)) as body:
+            async for chunk in body:
+                yield chunk
+    yield tail
+
+async def media_streamer(request: web.Request, id: int, secure_hash: str, signed: FileMeta = None):
+    """
+    Serves a stored file. A signed link passes its verified FileMeta in signed, which answers everything
+    up to the body on its own; the full metadata is only resolved once bytes have to come from Telegram.
+    """
+    started = time.monotonic()
+    if cluster.enabled and CLUSTER_HOP_HEADER not in request.headers and not cluster.is_local(id):
+        response = await route_to_owner(request, cluster.owner(id))
+        if response is not None:
+            return response
+
+    range_header = request.headers.get("Range")
+    
+    index = scheduler.pick(multi_clients)
+    tg_connect = get_streamer(index)
+    if signed is not None:
+        file_id = signed
     else:
-        logging.debug(f"Creating new ByteStreamer object for client {index}")
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
-    logging.debug("before calling get_file_properties")
-    file_id = await tg_connect.get_file_properties(id)
-    logging.debug("after calling get_file_properties")
+        logging.debug("before calling get_file_properties")
+        with tracer.span("get_file_properties", message_id=id):
+            file_id = await tg_connect.get_file_properties(id)
+        logging.debug("after calling get_file_properties")
+
+    best_index = scheduler.pick(multi_clients, file_id.dc_id)
+    if best_index != index:
+        index = best_index
+        tg_connect = get_streamer(index)
+
+    if MULTI_CLIENT:
+        logging.info(f"Client {index} is now serving {request.remote}")
     
     if file_id.unique_id[:6] != secure_hash:
         logging.debug(f"Invalid hash for message with ID {id}")
         raise InvalidHash
     
     file_size = file_id.file_size
+    etag = f'"{file_id.unique_id}"'
 
-    if range_header:
-        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
-        from_bytes = int(from_bytes)
-        until_bytes = int(until_bytes) if until_bytes else file_size - 1
-    else:
-        from_bytes = request.http_range.start or 0
-        until_bytes = (request.http_range.stop or file_size) - 1
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return web.Response(status=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+    if_range = request.headers.get("If-Range")
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
 
-    if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
+    try:
+        ranges = parse_range(range_header, file_size) if range_header else None
+    except RangeNotSatisfiable as e:
         return web.Response(
             status=416,
-            body="416: Range not satisfiable",
+            body=e.message,
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    chunk_size = 1024 * 1024
-    until_bytes = min(until_bytes, file_size - 1)
-
-    offset = from_bytes - (from_bytes % chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = until_bytes % chunk_size + 1
-
-    req_length = until_bytes - from_bytes + 1
-    part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
-    body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
-
     mime_type = file_id.mime_type
     file_name = file_id.file_name
     disposition = "attachment"
@@ -148,19 +421,78 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
                 file_name = f"{secrets.token_hex(2)}.unknown"
     else:
         if file_name:
-            mime_type = mimetypes.guess_type(file_id.file_name)
+            mime_type = mimetypes.guess_type(file_id.file_name)[0] or "application/octet-stream"
         else:
             mime_type = "application/octet-stream"
             file_name = f"{secrets.token_hex(2)}.unknown"
 
+    headers = {
+        "Content-Disposition": f'{disposition}; filename="{file_name}"',
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+    }
+
+    stripe = None
+    if STRIPED_STREAM and len(multi_clients) > 1:
+        lanes = scheduler.rank(multi_clients, file_id.dc_id)[:STRIPE_WIDTH or None]
+        stripe = [(lane, get_streamer(lane)) for lane in lanes]
+
+    if ranges and request.method != "HEAD":
+        for start, end in ranges:
+            range_size.observe(end - start + 1)
+
+    if ranges and len(ranges) > 1:
+        boundary = secrets.token_hex(16)
+        part_heads = [
+            (b"\r\n" if i else b"")
+            + f"--{boundary}\r\nContent-Type: {mime_type}\r\nContent-Range: bytes {start}-{end}/{file_size}\r\n\r\n".encode()
+            for i, (start, end) in enumerate(ranges)
+        ]
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        req_length = sum(len(head) for head in part_heads) + sum(end - start + 1 for start, end in ranges) + len(tail)
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        headers["Content-Length"] = str(req_length)
+        if request.method == "HEAD":
+            return web.Response(status=206, headers=headers)
+        file_id = await resolve_file(tg_connect, file_id, id)
+        index_cache.schedule(tg_connect, file_id, mime_type, file_name)
+        return web.Response(
+            status=206,
+            body=metered_body(multipart_body(tg_connect, file_id, index, ranges, part_heads, tail, stripe, id), started),
+            headers=headers,
+        )
+
+    headers["Content-Type"] = f"{mime_type}"
+    if ranges:
+        status = 206
+        from_bytes, until_bytes = ranges[0]
+        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+    else:
+        status = 200
+        from_bytes, until_bytes = 0, file_size - 1
+    headers["Content-Length"] = str(until_bytes - from_bytes + 1)
+    if file_size == 0 or request.method == "HEAD":
+        return web.Response(status=status, headers=headers)
+
+    chunk_size = CHUNK_SIZE
+    first_index = from_bytes // chunk_size
+    last_index = until_bytes // chunk_size
+    if disk_cache.enabled and disk_cache.covers(file_id.unique_id, first_index, last_index):
+        files = await disk_cache.open_range(file_id.unique_id, first_index, last_index)
+        if files:
+            logging.debug(f"Serving message ID {id} from disk cache")
+            parts = []
+            for chunk_index, fobj in zip(range(first_index, last_index + 1), files):
+                start = max(from_bytes, chunk_index * chunk_size)
+                end = min(until_bytes, (chunk_index + 1) * chunk_size - 1)
+                parts.append((fobj, start - chunk_index * chunk_size, end - start + 1))
+            return ChunkFileResponse(parts, status=status, headers=headers, started=started)
+
+    file_id = await resolve_file(tg_connect, file_id, id)
+    index_cache.schedule(tg_connect, file_id, mime_type, file_name)
     return web.Response(
-        status=206 if range_header else 200,
-        body=body,
-        headers={
-            "Content-Type": f"{mime_type}",
-            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-            "Content-Length": str(req_length),
-            "Content-Disposition": f'{disposition}; filename="{file_name}"',
-            "Accept-Ranges": "bytes",
-        },
+        status=status,
+        body=metered_body(stream_range(tg_connect, file_id, index, from_bytes, until_bytes, stripe, id), started),
+        headers=headers,
     )
@@ -0,0 +1,104 @@
+import time
+import socket
+import asyncio
+import logging
+import logging.config
+import multiprocessing
+from typing import Dict
+from aiohttp import web
+from config import PORT, STREAM_WORKERS, MEDIA_SESSION_PREWARM
+
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+
+
+async def serve(worker: int, workers: int) -> None:
+    """Runs one stream worker: its own clients, session pool and caches, on the port shared by all workers."""
+    from TechVJ.server import web_server
+    from TechVJ.bot import multi_clients
+    from TechVJ.bot.clients import initialize_worker_clients
+    from TechVJ.bot.session_pool import session_pool
+    from TechVJ.utils.file_cache import file_cache
+
+    await initialize_worker_clients(worker, workers)
+    await file_cache.warm()
+    if MEDIA_SESSION_PREWARM:
+        asyncio.create_task(session_pool.prewarm(multi_clients.values()))
+    asyncio.create_task(session_pool.maintain())
+
+    app = web.AppRunner(await web_server())
+    await app.setup()
+    await web.TCPSite(app, "0.0.0.0", PORT, reuse_port=True).start()
+    logging.info(f"Stream worker {worker} listening on port {PORT}")
+    await asyncio.Event().wait()
+
+
+def run(worker: int, workers: int) -> None:
+    """Entry point of a worker process."""
+    logging.config.fileConfig("logging.conf")
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger("pyrogram").setLevel(logging.ERROR)
+    try:
+        asyncio.run(serve(worker, workers))
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    def __init__(self, count: int = STREAM_WORKERS):
+        """
+        Starts the stream server as count separate processes bound to the same port with SO_REUSEPORT,
+        so the kernel spreads connections over them and streaming is no longer limited to one core.
+
+        Each worker owns a slice of the MULTI_TOKEN clients. Workers share file metadata through the
+        SQLite file store and chunks through the disk cache; the in-memory caches are per worker.
+
+        Attributes:
+            count: number of worker processes.
+            processes: running worker process by worker number.
+        """
+        self.count = count
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.restarts: Dict[int, int] = {}
+        self.started: Dict[int, float] = {}
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(socket, "SO_REUSEPORT")
+
+    def spawn(self, worker: int) -> None:
+        process = self.context.Process(target=run, args=(worker, self.count), name=f"stream-worker-{worker}", daemon=True)
+        process.start()
+        self.processes[worker] = process
+        self.started[worker] = time.monotonic()
+        logging.info(f"Started stream worker {worker} (pid {process.pid})")
+
+    def start(self) -> None:
+        for worker in range(self.count):
+            self.spawn(worker)
+
+    async def supervise(self) -> None:
+        """Restarts workers that exit, backing off when one keeps failing."""
+        while True:
+            await asyncio.sleep(RESTART_DELAY)
+            for worker, process in list(self.processes.items()):
+                if process.is_alive():
+                    continue
+                restarts = self.restarts.get(worker, 0)
+                if time.monotonic() - self.started[worker] > MAX_RESTART_DELAY:
+                    restarts = 0
+                delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** restarts)
+                logging.warning(f"Stream worker {worker} exited with code {process.exitcode}, restarting in {delay}s")
+                self.restarts[worker] = restarts + 1
+                self.processes.pop(worker)
+                asyncio.get_running_loop().call_later(delay, self.spawn, worker)
+
+    def stop(self) -> None:
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join(10)
+
+
+worker_pool = WorkerPool()
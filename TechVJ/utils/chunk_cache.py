@@ -0,0 +1,309 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from config import DISK_CACHE_DIR, DISK_CACHE_SIZE, MEMORY_CACHE_SIZE, STREAM_WORKERS
+
+CHUNK_SIZE = 1024 * 1024
+STALE_TMP_AGE = 600
+
+
+class MemoryChunkCache:
+    def __init__(self, max_bytes: int, protected_ratio: float = 0.8):
+        """
+        A process-wide RAM cache of recently served chunks, shared by every stream client.
+
+        It is a segmented LRU: new chunks enter the probation segment and move to the protected
+        segment on their second hit, so one long sequential download cannot flush the header and
+        trailer chunks that players keep probing.
+
+        Attributes:
+            max_bytes: strict byte budget for both segments together.
+            hits / misses: lookup counters.
+        """
+        self.max_bytes = max_bytes
+        self.max_protected = int(max_bytes * protected_ratio)
+        self.probation: "OrderedDict[Tuple[str, int, int], bytes]" = OrderedDict()
+        self.protected: "OrderedDict[Tuple[str, int, int], bytes]" = OrderedDict()
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self.probation_bytes + self.protected_bytes
+
+    def __contains__(self, key: Tuple[str, int, int]) -> bool:
+        return key in self.protected or key in self.probation
+
+    def get(self, unique_id: str, offset: int, limit: int) -> Optional[bytes]:
+        key = (unique_id, offset, limit)
+        data = self.protected.get(key)
+        if data is not None:
+            self.protected.move_to_end(key)
+            self.hits += 1
+            return data
+        data = self.probation.pop(key, None)
+        if data is None:
+            self.misses += 1
+            return None
+        self.probation_bytes -= len(data)
+        self.protected[key] = data
+        self.protected_bytes += len(data)
+        while self.protected_bytes > self.max_protected and len(self.protected) > 1:
+            old_key, old_data = self.protected.popitem(last=False)
+            self.protected_bytes -= len(old_data)
+            self.probation[old_key] = old_data
+            self.probation_bytes += len(old_data)
+        self.evict()
+        self.hits += 1
+        return data
+
+    def put(self, unique_id: str, offset: int, limit: int, data: bytes) -> None:
+        key = (unique_id, offset, limit)
+        if not self.enabled or len(data) > self.max_bytes // 4 or key in self.protected or key in self.probation:
+            return
+        self.probation[key] = data
+        self.probation_bytes += len(data)
+        self.evict()
+
+    def evict(self) -> None:
+        while self.total_bytes > self.max_bytes:
+            segment = self.probation if self.probation else self.protected
+            _, data = segment.popitem(last=False)
+            if segment is self.probation:
+                self.probation_bytes -= len(data)
+            else:
+                self.protected_bytes -= len(data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks": len(self.probation) + len(self.protected),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class DiskChunkCache:
+    def __init__(self, root: str, max_bytes: int, chunk_size: int = CHUNK_SIZE, writers: int = 1):
+        """
+        An on-disk store of media chunks keyed by (file_unique_id, chunk_index).
+
+        Every entry is one chunk_size aligned part of a file (the last part of a file may be shorter).
+        Writes go to a temporary file that is renamed into place, so a crash never leaves a torn chunk.
+
+        When several processes share root, the budget covers the whole directory rather than each process:
+        a process rescans root after writing a 1/(4 * writers) share of the budget, or when its own index
+        goes over it, and evicts the least recently read chunks of every process. Reads touch the chunk
+        files so their mtime orders that LRU. The directory can exceed the budget by at most a quarter
+        between scans.
+
+        Attributes:
+            root: directory that holds one sub-directory per file_unique_id.
+            max_bytes: byte budget; least recently used chunks are evicted above it.
+            entries: LRU ordered map of (file_unique_id, chunk_index) to chunk size.
+            writers: processes writing to root; above 1 the cache is shared, chunks missing from entries are
+                looked up on disk and the budget is enforced by scanning root.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.shared = writers > 1
+        self.scan_bytes = max_bytes // (4 * writers)
+        self.entries: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        self.total_bytes = 0
+        self.written = 0
+        self.scanning = False
+        self.writes: Dict[Tuple[str, int], asyncio.Task] = {}
+        if self.enabled:
+            self.load()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root) and self.max_bytes > 0
+
+    def path_for(self, unique_id: str, index: int) -> str:
+        return os.path.join(self.root, unique_id, str(index))
+
+    def load(self) -> None:
+        """Indexes the chunks already on disk, dropping leftovers of interrupted writes."""
+        self.index(self.scan())
+        self.evict()
+        logging.info(f"Disk chunk cache loaded {len(self.entries)} chunks ({self.total_bytes} bytes)")
+
+    async def rescan(self) -> None:
+        """Reindexes root, including the chunks other processes wrote, and evicts down to the budget."""
+        if self.scanning:
+            return
+        self.scanning = True
+        self.written = 0
+        try:
+            found = await asyncio.to_thread(self.scan)
+        except OSError:
+            logging.warning("Failed to scan disk chunk cache", exc_info=True)
+            return
+        finally:
+            self.scanning = False
+        self.index(found)
+        self.evict()
+
+    def scan(self) -> List[Tuple[float, str, int, int]]:
+        """Returns (mtime, file_unique_id, chunk_index, size) of every chunk on disk, least recently read first."""
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for folder in os.scandir(self.root):
+            if not folder.is_dir():
+                continue
+            try:
+                entries = list(os.scandir(folder.path))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                # Other workers sharing the directory rename and evict files while this one scans it
+                try:
+                    stat = entry.stat()
+                    if not entry.name.isdigit():
+                        # A recent temporary file may still be written by another process
+                        if time.time() - stat.st_mtime > STALE_TMP_AGE:
+                            os.remove(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, folder.name, int(entry.name), stat.st_size))
+        return sorted(found)
+
+    def index(self, found: List[Tuple[float, str, int, int]]) -> None:
+        self.entries = OrderedDict(((unique_id, index), size) for _, unique_id, index, size in found)
+        self.total_bytes = sum(self.entries.values())
+
+    def has(self, unique_id: str, index: int) -> bool:
+        if (unique_id, index) in self.entries:
+            return True
+        return self.shared and self.adopt(unique_id, index)
+
+    def adopt(self, unique_id: str, index: int) -> bool:
+        """Indexes a chunk another process wrote since this one loaded the cache."""
+        try:
+            size = os.stat(self.path_for(unique_id, index)).st_size
+        except OSError:
+            return False
+        self.entries[(unique_id, index)] = size
+        self.total_bytes += size
+        self.evict()
+        return (unique_id, index) in self.entries
+
+    def covers(self, unique_id: str, first_index: int, last_index: int) -> bool:
+        """Returns True if every chunk between first_index and last_index is cached."""
+        return all(self.has(unique_id, index) for index in range(first_index, last_index + 1))
+
+    def is_complete(self, data: bytes, index: int, file_size: int) -> bool:
+        """A chunk may be stored only if it is a full part or the tail of the file."""
+        return len(data) == self.chunk_size or (0 < len(data) and index * self.chunk_size + len(data) == file_size)
+
+    async def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        key = (unique_id, index)
+        if key not in self.entries:
+            return None
+        try:
+            data = await asyncio.to_thread(self._read, self.path_for(unique_id, index))
+        except FileNotFoundError:
+            self.discard(key)
+            return None
+        self.entries.move_to_end(key)
+        return data
+
+    async def put(self, unique_id: str, index: int, data: bytes) -> None:
+        key = (unique_id, index)
+        if not self.enabled or key in self.entries:
+            return
+        try:
+            await asyncio.to_thread(self._write, self.path_for(unique_id, index), data)
+        except OSError:
+            logging.warning(f"Failed to write chunk {index} of {unique_id} to disk cache", exc_info=True)
+            return
+        if key in self.entries:
+            return
+        self.entries[key] = len(data)
+        self.total_bytes += len(data)
+        if self.shared:
+            self.written += len(data)
+            if self.written >= self.scan_bytes or self.total_bytes > self.max_bytes:
+                await self.rescan()
+                return
+        self.evict()
+
+    def store(self, unique_id: str, index: int, data: bytes) -> None:
+        """Writes a chunk in the background so the stream is never held up by disk I/O."""
+        key = (unique_id, index)
+        if not self.enabled or key in self.entries or key in self.writes:
+            return
+        task = asyncio.create_task(self.put(unique_id, index, data))
+        self.writes[key] = task
+        task.add_done_callback(lambda _: self.writes.pop(key, None))
+
+    async def open_range(self, unique_id: str, first_index: int, last_index: int) -> Optional[List[BinaryIO]]:
+        """
+        Opens the chunk files for a range so they can be sent with sendfile.
+        Returns None if any chunk vanished in the meantime.
+        """
+        files = []
+        try:
+            for index in range(first_index, last_index + 1):
+                files.append(await asyncio.to_thread(self._open, self.path_for(unique_id, index)))
+                self.entries.move_to_end((unique_id, index))
+        except (FileNotFoundError, KeyError):
+            for f in files:
+                f.close()
+            for index in range(first_index, last_index + 1):
+                if not os.path.exists(self.path_for(unique_id, index)):
+                    self.discard((unique_id, index))
+            return None
+        return files
+
+    def discard(self, key: Tuple[str, int]) -> None:
+        size = self.entries.pop(key, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self.entries:
+            (unique_id, index), size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path_for(unique_id, index))
+            except FileNotFoundError:
+                pass
+            logging.debug(f"Evicted chunk {index} of {unique_id} from disk cache")
+
+    @staticmethod
+    def _open(path: str) -> BinaryIO:
+        f = open(path, "rb")
+        os.utime(path)
+        return f
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with DiskChunkCache._open(path) as f:
+            return f.read()
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+memory_cache = MemoryChunkCache(MEMORY_CACHE_SIZE * 1024 * 1024)
+disk_cache = DiskChunkCache(DISK_CACHE_DIR, DISK_CACHE_SIZE * 1024 * 1024, writers=max(1, STREAM_WORKERS))
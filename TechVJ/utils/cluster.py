@@ -0,0 +1,104 @@
+import os
+import time
+import bisect
+import hashlib
+import logging
+from typing import List, Optional, Tuple
+from config import URL, CLUSTER_NODES, CLUSTER_NODES_FILE, CLUSTER_SELF
+
+VIRTUAL_NODES = 160
+RELOAD_INTERVAL = 5
+
+
+def normalize(node: str) -> str:
+    node = node.strip()
+    return node if node.endswith("/") else node + "/"
+
+
+def ring_position(key: str) -> int:
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: List[str], replicas: int = VIRTUAL_NODES):
+        """
+        A consistent hash ring: each node owns the keys between its virtual points and the previous ones,
+        so adding or removing a node only moves about 1/len(nodes) of the keys.
+        """
+        self.nodes = nodes
+        self.points: List[Tuple[int, str]] = sorted(
+            (ring_position(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self.keys = [point for point, _ in self.points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self.points:
+            return None
+        index = bisect.bisect(self.keys, ring_position(key)) % len(self.points)
+        return self.points[index][1]
+
+
+class Cluster:
+    def __init__(self, nodes: str = CLUSTER_NODES, nodes_file: str = CLUSTER_NODES_FILE, self_url: str = CLUSTER_SELF or URL):
+        """
+        Assigns every LOG_CHANNEL message to one stream node by consistent hashing of its id, so that each
+        node only warms its caches for its own slice of the catalogue.
+
+        Membership is the static nodes list plus the nodes file, which is reread when it changes.
+
+        Attributes:
+            static_nodes: node base URLs from the config.
+            nodes_file: optional file with one node base URL per line.
+            self_url: base URL of this node as it appears in the node list.
+        """
+        self.static_nodes = [normalize(node) for node in nodes.split(",") if node.strip()]
+        self.nodes_file = nodes_file
+        self.self_url = normalize(self_url)
+        self.file_mtime: Optional[float] = None
+        self.checked_at = 0.0
+        self.ring = HashRing(sorted(set(self.static_nodes)))
+        self.reload()
+
+    @property
+    def enabled(self) -> bool:
+        self.reload()
+        return len(self.ring.nodes) > 1
+
+    def reload(self) -> None:
+        """Rebuilds the ring if the nodes file changed, checking at most every RELOAD_INTERVAL seconds."""
+        if not self.nodes_file:
+            return
+        now = time.monotonic()
+        if now - self.checked_at < RELOAD_INTERVAL and self.file_mtime is not None:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.stat(self.nodes_file).st_mtime
+            if mtime == self.file_mtime:
+                return
+            with open(self.nodes_file) as f:
+                file_nodes = [normalize(line) for line in f if line.strip() and not line.lstrip().startswith("#")]
+        except OSError:
+            logging.warning(f"Failed to read cluster nodes from {self.nodes_file}", exc_info=True)
+            return
+        self.file_mtime = mtime
+        nodes = sorted(set(self.static_nodes + file_nodes))
+        if nodes != self.ring.nodes:
+            self.ring = HashRing(nodes)
+            logging.info(f"Cluster membership changed to {nodes}")
+
+    def owner(self, message_id: int) -> str:
+        """Returns the base URL of the node that serves a message, this node when clustering is off."""
+        if not self.enabled:
+            return self.self_url
+        return self.ring.owner(str(message_id))
+
+    def is_local(self, message_id: int) -> bool:
+        return self.owner(message_id) == self.self_url
+
+    def url_for(self, message_id: int) -> str:
+        """Base URL to put in links to a message, so players go straight to its owner."""
+        return self.owner(message_id) if self.enabled else URL
+
+
+cluster = Cluster()
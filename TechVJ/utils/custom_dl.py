@@ -1,83 +1,55 @@
 import math
+import time
 import asyncio
 import logging
-from typing import Dict, Union
-from config import LOG_CHANNEL
-from TechVJ.bot import work_loads
+from collections import deque
+from typing import List, Optional, Tuple, Union
+from config import LOG_CHANNEL, STREAM_PREFETCH
+from TechVJ.bot import multi_clients, work_loads
+from TechVJ.bot.scheduler import scheduler
+from TechVJ.bot.session_pool import session_pool
 from pyrogram import Client, utils, raw
-from .file_properties import get_file_ids
-from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
-from TechVJ.server.exceptions import FIleNotFound
-from pyrogram.file_id import FileId, FileType, ThumbnailSource
+from .file_properties import FileMeta, get_file_meta
+from .file_cache import file_cache
+from .chunk_cache import CHUNK_SIZE, disk_cache, memory_cache
+from .media_index import index_cache
+from .single_flight import SingleFlight
+from .tracing import tracer
+from .metrics import disk_lookups, flood_waits, flood_wait_seconds, getfile_errors, getfile_latency
+from pyrogram.session import Session
+from pyrogram.errors import FloodWait, FileReferenceEmpty, FileReferenceExpired, FileReferenceInvalid, Unauthorized
+from pyrogram.file_id import FileType, ThumbnailSource
+
+MAX_STREAM_RETRIES = 3
+
+chunk_flight = SingleFlight()
 
 
 class ByteStreamer:
-    def __init__(self, client: Client):
+    def __init__(self, client: Client, index: int = 0):
         """
         A custom class that holds the cache of a specific client and provides streaming functions.
 
         Attributes:
             client: the client that the cache is for.
-            cached_file_ids: a dict of cached file IDs.
+            index: the key of the client in multi_clients, used to report load to the scheduler.
+            rtt: moving average of GetFile round-trip time in seconds, used to size the read-ahead window.
         """
-        self.clean_timer = 30 * 60
         self.client: Client = client
-        self.cached_file_ids: Dict[int, FileId] = {}
-        asyncio.create_task(self.clean_cache())
-
-    async def get_file_properties(self, message_id: int) -> FileId:
-        """Returns cached file properties or generates them if not cached."""
-        if message_id not in self.cached_file_ids:
-            await self.generate_file_properties(message_id)
-            logging.debug(f"Cached file properties for message ID {message_id}")
-        return self.cached_file_ids[message_id]
-
-    async def generate_file_properties(self, message_id: int) -> FileId:
-        """Generates file properties from message and caches them."""
-        file_id = await get_file_ids(self.client, LOG_CHANNEL, message_id)
-        if not file_id:
-            logging.debug(f"Message with ID {message_id} not found")
-            raise FIleNotFound
-        self.cached_file_ids[message_id] = file_id
-        logging.debug(f"Cached media message with ID {message_id}")
-        return file_id
-
-    async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
-        """Generates or retrieves the media session for a given DC."""
-        media_session = client.media_sessions.get(file_id.dc_id)
-        if not media_session:
-            if file_id.dc_id != await client.storage.dc_id():
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await Auth(client, file_id.dc_id, await client.storage.test_mode()).create(),
-                    await client.storage.test_mode(),
-                    is_media=True
-                )
-                await media_session.start()
-                for _ in range(6):
-                    exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id))
-                    try:
-                        await media_session.send(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
-                        break
-                    except AuthBytesInvalid:
-                        logging.debug(f"Invalid authorization bytes for DC {file_id.dc_id}")
-                        continue
-                else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
-            else:
-                media_session = Session(client, file_id.dc_id, await client.storage.auth_key(), await client.storage.test_mode(), is_media=True)
-                await media_session.start()
-            logging.debug(f"Created media session for DC {file_id.dc_id}")
-            client.media_sessions[file_id.dc_id] = media_session
-        else:
-            logging.debug(f"Using cached media session for DC {file_id.dc_id}")
-        return media_session
+        self.index = index
+        self.rtt: Optional[float] = None
+
+    async def get_file_properties(self, message_id: int) -> FileMeta:
+        """Returns the file properties from the shared cache, resolving them with this client on a miss."""
+        return await file_cache.get(message_id, lambda mid: get_file_meta(self.client, LOG_CHANNEL, mid))
+
+    async def generate_media_session(self, client: Client, file_id: FileMeta) -> Session:
+        """Returns the pooled media session of the client for the DC of the file."""
+        with tracer.span("generate_media_session", dc=file_id.dc_id, client=self.index):
+            return await session_pool.get(client, file_id.dc_id)
 
     @staticmethod
-    async def get_location(file_id: FileId) -> Union[raw.types.InputPhotoFileLocation,
+    async def get_location(file_id: FileMeta) -> Union[raw.types.InputPhotoFileLocation,
                                                      raw.types.InputDocumentFileLocation,
                                                      raw.types.InputPeerPhotoFileLocation]:
         """Returns the InputFile location for the media."""
@@ -96,44 +68,180 @@ class ByteStreamer:
         else:
             return raw.types.InputDocumentFileLocation(id=file_id.media_id, access_hash=file_id.access_hash, file_reference=file_id.file_reference, thumb_size=file_id.thumbnail_size)
 
-    async def yield_file(self, file_id: FileId, index: int, offset: int, first_part_cut: int, last_part_cut: int, part_count: int, chunk_size: int):
-        """Generator to yield bytes from Telegram media."""
-        client = self.client
-        work_loads[index] += 1
-        logging.debug(f"Starting to yield file with client {index}")
-        media_session = await self.generate_media_session(client, file_id)
+    async def get_file(self, media_session: Session, location, offset: int, limit: int) -> bytes:
+        """Fetches a single part of the media and reports its round-trip time to the scheduler."""
+        scheduler.request_started(self.index)
+        session_pool.touch(self.client, media_session.dc_id)
+        start = time.monotonic()
+        try:
+            with tracer.span("getfile", client=self.index, offset=offset, limit=limit):
+                r = await media_session.send(raw.functions.upload.GetFile(location=location, offset=offset, limit=limit))
+        except FloodWait as e:
+            scheduler.request_finished(self.index, error=True)
+            scheduler.flood_wait(self.index, e.value)
+            flood_waits.inc(str(self.index))
+            flood_wait_seconds.inc(str(self.index), amount=e.value)
+            raise
+        except Unauthorized:
+            scheduler.request_finished(self.index, error=True)
+            getfile_errors.inc(str(self.index))
+            await session_pool.invalidate(self.client, media_session)
+            raise
+        except BaseException:
+            scheduler.request_finished(self.index, error=True)
+            getfile_errors.inc(str(self.index))
+            raise
+        rtt = time.monotonic() - start
+        scheduler.request_finished(self.index, rtt)
+        getfile_latency.observe(rtt, str(self.index))
+        self.rtt = rtt if self.rtt is None else self.rtt * 0.8 + rtt * 0.2
+        if isinstance(r, raw.types.upload.File):
+            return r.bytes
+        return b""
+
+    async def fetch_part(self, file_id: FileMeta, media_session: Session, location, offset: int, limit: int) -> bytes:
+        """Returns one part of the media, sharing a single fetch between concurrent streams of the same part."""
+        chunk = index_cache.get(file_id.unique_id, offset, limit)
+        if chunk is not None:
+            return chunk
+        base = offset - offset % CHUNK_SIZE
+        if limit < CHUNK_SIZE and (file_id.unique_id, base, CHUNK_SIZE) in memory_cache:
+            chunk = memory_cache.get(file_id.unique_id, base, CHUNK_SIZE)
+            return chunk[offset - base:offset - base + limit]
+        chunk = memory_cache.get(file_id.unique_id, offset, limit)
+        if chunk is not None:
+            return chunk
+        return await chunk_flight.do(
+            (file_id.media_id, offset, limit),
+            lambda: self.load_part(file_id, media_session, location, offset, limit)
+        )
+
+    async def load_part(self, file_id: FileMeta, media_session: Session, location, offset: int, limit: int) -> bytes:
+        """Reads one part from the disk cache or Telegram and fills the caches with it."""
+        base = offset - offset % CHUNK_SIZE
+        index = base // CHUNK_SIZE
+        if disk_cache.enabled and disk_cache.has(file_id.unique_id, index):
+            chunk = await disk_cache.get(file_id.unique_id, index)
+            if chunk is not None:
+                disk_lookups.inc("hit")
+                memory_cache.put(file_id.unique_id, base, CHUNK_SIZE, chunk)
+                return chunk[offset - base:offset - base + limit]
+        if disk_cache.enabled:
+            disk_lookups.inc("miss")
+        chunk = await self.get_file(media_session, location, offset, limit)
+        if chunk:
+            memory_cache.put(file_id.unique_id, offset, limit, chunk)
+        if limit == CHUNK_SIZE and disk_cache.enabled and disk_cache.is_complete(chunk, index, file_id.file_size):
+            disk_cache.store(file_id.unique_id, index, chunk)
+        return chunk
+
+    def prefetch_window(self, consume_time: float) -> int:
+        """Returns how many parts to keep in flight so that fetching keeps up with the reader."""
+        if self.rtt is None or consume_time <= 0:
+            return min(2, STREAM_PREFETCH)
+        return max(1, min(STREAM_PREFETCH, math.ceil(self.rtt / consume_time) + 1))
+
+    @staticmethod
+    def cancel_parts(pending: deque) -> None:
+        """Cancels part fetches that will not be yielded."""
+        for _, task in pending:
+            task.cancel()
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        pending.clear()
+
+    async def yield_file(self, file_id: FileMeta, index: int, parts: List[Tuple[int, int, int, int]],
+                         stripe: Optional[List[Tuple[int, "ByteStreamer"]]] = None, message_id: Optional[int] = None):
+        """
+        Generator to yield bytes from Telegram media, keeping a window of parts in flight.
+
+        parts are (offset, limit, cut_start, cut_end) GetFile parts as planned by range_planner.plan_parts;
+        chunk[cut_start:cut_end] of each one is yielded, in order.
+
+        If stripe is given as (client index, ByteStreamer) pairs, consecutive parts are fetched
+        round-robin through each of those clients instead of only this one.
+
+        If the file reference expires mid-stream, or a part times out, the parts still in flight are dropped
+        and fetching resumes at the first part not yet yielded; with message_id the file location is refreshed first.
+        If Telegram revokes the auth key of a media session, that lane gets a freshly authorized session.
+        Each part gets MAX_STREAM_RETRIES of these recoveries. Any other failure, an empty part or running out
+        of retries raises, so that the server aborts the response instead of ending it short of its Content-Length.
+        """
+        # The clients were picked when the response was built; one may have been drained since, so only
+        # lanes still in the balancer are kept, and their load is reserved before anything is awaited.
+        lanes = [(lane, streamer) for lane, streamer in stripe or [(index, self)] if multi_clients.get(lane) is streamer.client]
+        if not lanes:
+            index = scheduler.pick(multi_clients, file_id.dc_id)
+            lanes = [(index, ByteStreamer(multi_clients[index], index))]
+        share = sum(cut_end - cut_start for _, _, cut_start, cut_end in parts) // len(lanes)
+        assigned = {}
+        for lane_index, _ in lanes:
+            work_loads[lane_index] = work_loads.get(lane_index, 0) + 1
+            scheduler.stream_started(lane_index, share)
+            assigned[lane_index] = share
+        logging.debug(f"Starting to yield file with clients {list(assigned)}")
 
-        current_part = 1
-        location = await self.get_location(file_id)
+        current_part = 0
+        pending = deque()
+        consume_time = 0.0
+        retries = 0
         try:
-            r = await media_session.send(raw.functions.upload.GetFile(location=location, offset=offset, limit=chunk_size))
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-                    current_part += 1
-                    offset += chunk_size
-                    if current_part > part_count:
-                        break
-                    r = await media_session.send(raw.functions.upload.GetFile(location=location, offset=offset, limit=chunk_size))
-        except (TimeoutError, AttributeError):
-            pass
+            sessions = await asyncio.gather(
+                *[streamer.generate_media_session(streamer.client, file_id) for _, streamer in lanes],
+                return_exceptions=True
+            )
+            lanes = [(lane, session) for lane, session in zip(lanes, sessions) if not isinstance(session, BaseException)]
+            if not lanes:
+                raise sessions[0]
+            location = await self.get_location(file_id)
+            while current_part < len(parts):
+                window = self.prefetch_window(consume_time) * len(lanes)
+                while current_part + len(pending) < len(parts) and len(pending) < window:
+                    part = current_part + len(pending)
+                    offset, limit, _, _ = parts[part]
+                    (lane_index, streamer), media_session = lanes[part % len(lanes)]
+                    task = asyncio.create_task(streamer.fetch_part(file_id, media_session, location, offset, limit))
+                    pending.append((lane_index, task))
+                lane_index, task = pending.popleft()
+                try:
+                    chunk = await task
+                except (FileReferenceExpired, FileReferenceInvalid, FileReferenceEmpty, TimeoutError) as e:
+                    if retries >= MAX_STREAM_RETRIES or (message_id is None and not isinstance(e, TimeoutError)):
+                        raise
+                    retries += 1
+                    self.cancel_parts(pending)
+                    if not isinstance(e, TimeoutError):
+                        logging.info(f"File reference of message ID {message_id} expired, refreshing it")
+                        file_id = await file_cache.renew(message_id, file_id)
+                        location = await self.get_location(file_id)
+                    continue
+                except Unauthorized:
+                    if retries >= MAX_STREAM_RETRIES:
+                        raise
+                    retries += 1
+                    self.cancel_parts(pending)
+                    position = next(i for i, ((lane, _), _) in enumerate(lanes) if lane == lane_index)
+                    streamer = lanes[position][0][1]
+                    lanes[position] = ((lane_index, streamer), await streamer.generate_media_session(streamer.client, file_id))
+                    continue
+                if not chunk:
+                    offset, limit, _, _ = parts[current_part]
+                    raise EOFError(f"Telegram returned no data for part at offset {offset} with limit {limit}")
+                _, _, cut_start, cut_end = parts[current_part]
+                data = chunk[cut_start:cut_end]
+                scheduler.stream_progress(lane_index, len(data))
+                assigned[lane_index] = max(0, assigned[lane_index] - len(data))
+                yielded_at = time.monotonic()
+                yield data
+                elapsed = time.monotonic() - yielded_at
+                consume_time = elapsed if current_part == 0 else consume_time * 0.8 + elapsed * 0.2
+                current_part += 1
+                retries = 0
+        except Exception:
+            logging.warning(f"Stream failed at part {current_part + 1} of {len(parts)}", exc_info=True)
+            raise
         finally:
+            self.cancel_parts(pending)
             logging.debug(f"Finished yielding file with {current_part} parts.")
-            work_loads[index] -= 1
-
-    async def clean_cache(self) -> None:
-        """Periodically clears cached file IDs to save memory."""
-        while True:
-            await asyncio.sleep(self.clean_timer)
-            self.cached_file_ids.clear()
-            logging.debug("Cleaned the cache")
\ No newline at end of file
+            for lane_index, remaining in assigned.items():
+                work_loads[lane_index] -= 1
+                scheduler.stream_finished(lane_index, remaining)
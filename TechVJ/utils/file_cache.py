@@ -0,0 +1,154 @@
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set
+from config import LOG_CHANNEL, FILE_CACHE_SIZE, FILE_CACHE_TTL
+from TechVJ.bot import multi_clients, StreamBot
+from TechVJ.bot.scheduler import scheduler
+from TechVJ.server.exceptions import FIleNotFound
+from .file_properties import FileMeta, get_file_meta
+from .file_store import file_store
+from .single_flight import SingleFlight
+
+
+class _Entry:
+    __slots__ = ("meta", "expires_at", "used")
+
+    def __init__(self, meta: FileMeta, expires_at: float):
+        self.meta = meta
+        self.expires_at = expires_at
+        self.used = False
+
+
+async def load_file_meta(message_id: int) -> FileMeta:
+    """Resolves file metadata from LOG_CHANNEL with the best available client."""
+    client = multi_clients[scheduler.pick(multi_clients)] if multi_clients else StreamBot
+    return await get_file_meta(client, LOG_CHANNEL, message_id)
+
+
+class FileMetaCache:
+    def __init__(self, maxsize: int = FILE_CACHE_SIZE, ttl: int = FILE_CACHE_TTL, loader: Callable[[int], Awaitable[FileMeta]] = load_file_meta):
+        """
+        A bounded LRU of FileMeta records keyed by LOG_CHANNEL message id, shared by every stream client.
+
+        Each entry expires on its own jittered TTL. Entries that were read since they were last loaded are
+        refreshed in the background shortly before they expire, spread over the refresh interval, so hot files
+        never drop out of the cache and no two entries go back to Telegram at the same moment.
+
+        Attributes:
+            maxsize: maximum number of entries kept.
+            ttl: average lifetime of an entry in seconds.
+            loader: coroutine function resolving a message id to a FileMeta.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.loader = loader
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.flight = SingleFlight()
+        self.refresher: Optional[asyncio.Task] = None
+        self.refreshes: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def expiry(self) -> float:
+        return time.monotonic() + self.ttl * random.uniform(0.9, 1.1)
+
+    def peek(self, message_id: int) -> Optional[FileMeta]:
+        """Returns a fresh cached entry without loading anything."""
+        entry = self.entries.get(message_id)
+        if entry and entry.expires_at > time.monotonic():
+            entry.used = True
+            self.entries.move_to_end(message_id)
+            return entry.meta
+        return None
+
+    async def get(self, message_id: int, loader: Optional[Callable[[int], Awaitable[FileMeta]]] = None) -> FileMeta:
+        if self.refresher is None:
+            self.refresher = asyncio.create_task(self.refresh_loop())
+        meta = self.peek(message_id)
+        if meta is not None:
+            self.hits += 1
+            return meta
+        self.misses += 1
+        return await self.flight.do(message_id, lambda: self.load(message_id, loader or self.loader, use_store=True))
+
+    async def load(self, message_id: int, loader: Callable[[int], Awaitable[FileMeta]], use_store: bool = False) -> FileMeta:
+        """
+        Loads an entry from the persistent store if allowed and the stored row is younger than the TTL,
+        else from Telegram, writing it through to the store.
+        """
+        if use_store:
+            meta = await file_store.get(message_id, self.ttl)
+            if meta is not None:
+                self.put(message_id, meta)
+                logging.debug(f"Loaded file properties for message ID {message_id} from file store")
+                return meta
+        try:
+            meta = await loader(message_id)
+        except FIleNotFound:
+            await file_store.delete(message_id)
+            raise
+        self.put(message_id, meta)
+        await file_store.put(message_id, meta)
+        logging.debug(f"Cached file properties for message ID {message_id}")
+        return meta
+
+    async def renew(self, message_id: int, stale: FileMeta) -> FileMeta:
+        """
+        Returns metadata with a newer file_reference than stale, going back to Telegram at most once
+        for all the streams that hit the same expired reference.
+        """
+        entry = self.entries.get(message_id)
+        if entry and entry.meta.file_reference != stale.file_reference:
+            return entry.meta
+        self.invalidate(message_id)
+        return await self.flight.do(("renew", message_id), lambda: self.load(message_id, self.loader))
+
+    async def warm(self) -> None:
+        """Fills the cache with the most recently resolved entries of the persistent store."""
+        entries = await file_store.recent(self.maxsize)
+        for message_id, meta in entries.items():
+            self.put(message_id, meta)
+        logging.info(f"Loaded {len(entries)} file metadata entries from file store")
+
+    def put(self, message_id: int, meta: FileMeta) -> None:
+        self.entries[message_id] = _Entry(meta, self.expiry())
+        self.entries.move_to_end(message_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, message_id: int) -> None:
+        self.entries.pop(message_id, None)
+
+    async def refresh(self, message_id: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.flight.do(message_id, lambda: self.load(message_id, self.loader))
+        except FIleNotFound:
+            self.invalidate(message_id)
+        except Exception:
+            logging.debug(f"Background refresh failed for message ID {message_id}", exc_info=True)
+
+    async def refresh_loop(self) -> None:
+        interval = max(1, self.ttl // 10)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for message_id, entry in list(self.entries.items()):
+                if entry.expires_at - now > 2 * interval:
+                    continue
+                if entry.used:
+                    entry.used = False
+                    task = asyncio.create_task(self.refresh(message_id, random.uniform(0, interval)))
+                    self.refreshes.add(task)
+                    task.add_done_callback(self.refreshes.discard)
+                elif entry.expires_at <= now:
+                    self.invalidate(message_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+file_cache = FileMetaCache()
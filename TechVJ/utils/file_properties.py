@@ -1,9 +1,77 @@
 from pyrogram import Client
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 from pyrogram.types import Message
-from pyrogram.file_id import FileId
+from pyrogram.file_id import FileId, FileType, ThumbnailSource
 from pyrogram.raw.types.messages import Messages
 from TechVJ.server.exceptions import FIleNotFound
+from .tracing import tracer
+
+
+class FileMeta:
+    """
+    The resolved metadata of a stored file: what the HTTP layer needs to answer a request
+    and the location fields needed to fetch its bytes with upload.GetFile.
+    """
+    __slots__ = (
+        "file_size", "mime_type", "file_name", "unique_id", "dc_id", "file_type", "media_id", "access_hash",
+        "file_reference", "thumbnail_size", "thumbnail_source", "volume_id", "local_id", "chat_id", "chat_access_hash",
+    )
+
+    def __init__(self, file_size: int, mime_type: str, file_name: str, unique_id: str, dc_id: int,
+                 file_type: FileType, media_id: int = None, access_hash: int = None, file_reference: bytes = b"",
+                 thumbnail_size: str = "", thumbnail_source: ThumbnailSource = None, volume_id: int = None,
+                 local_id: int = None, chat_id: int = None, chat_access_hash: int = None):
+        self.file_size = file_size
+        self.mime_type = mime_type
+        self.file_name = file_name
+        self.unique_id = unique_id
+        self.dc_id = dc_id
+        self.file_type = file_type
+        self.media_id = media_id
+        self.access_hash = access_hash
+        self.file_reference = file_reference
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_source = thumbnail_source
+        self.volume_id = volume_id
+        self.local_id = local_id
+        self.chat_id = chat_id
+        self.chat_access_hash = chat_access_hash
+
+    @classmethod
+    def from_media(cls, media: Any) -> "FileMeta":
+        file_id = FileId.decode(media.file_id)
+        return cls(
+            file_size=getattr(media, "file_size", 0) or 0,
+            mime_type=getattr(media, "mime_type", "") or "",
+            file_name=getattr(media, "file_name", "") or "",
+            unique_id=getattr(media, "file_unique_id", "") or "",
+            dc_id=file_id.dc_id,
+            file_type=file_id.file_type,
+            media_id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumbnail_size=file_id.thumbnail_size,
+            thumbnail_source=file_id.thumbnail_source,
+            volume_id=file_id.volume_id,
+            local_id=file_id.local_id,
+            chat_id=file_id.chat_id,
+            chat_access_hash=file_id.chat_access_hash,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["file_type"] = int(self.file_type)
+        data["thumbnail_source"] = None if self.thumbnail_source is None else int(self.thumbnail_source)
+        data["file_reference"] = self.file_reference.hex()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FileMeta":
+        data = dict(data)
+        data["file_type"] = FileType(data["file_type"])
+        data["thumbnail_source"] = None if data["thumbnail_source"] is None else ThumbnailSource(data["thumbnail_source"])
+        data["file_reference"] = bytes.fromhex(data["file_reference"])
+        return cls(**data)
 
 
 async def parse_file_id(message: Message) -> Optional[FileId]:
@@ -22,25 +90,17 @@ async def parse_file_unique_id(message: Message) -> Optional[str]:
     return None
 
 
-async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optional[FileId]:
+async def get_file_meta(client: Client, chat_id: int, message_id: int) -> FileMeta:
     """
-    Retrieves the FileId object and metadata from a message in a chat.
-    Raises FIleNotFound if the message is empty.
+    Retrieves the FileMeta of the media in a message.
+    Raises FIleNotFound if the message is empty or has no media.
     """
-    message = await client.get_messages(chat_id, message_id)
-    if not message:
-        raise FIleNotFound
-    media = get_media_from_message(message)
+    with tracer.span("get_messages", message_id=message_id):
+        message = await client.get_messages(chat_id, message_id)
+    media = get_media_from_message(message) if message else None
     if not media:
         raise FIleNotFound
-    file_unique_id = await parse_file_unique_id(message)
-    file_id = await parse_file_id(message)
-    if file_id:
-        setattr(file_id, "file_size", getattr(media, "file_size", 0))
-        setattr(file_id, "mime_type", getattr(media, "mime_type", ""))
-        setattr(file_id, "file_name", getattr(media, "file_name", ""))
-        setattr(file_id, "unique_id", file_unique_id)
-    return file_id
+    return FileMeta.from_media(media)
 
 
 def get_media_from_message(message: Message) -> Optional[Any]:
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+from config import FILE_META_DB
+from .file_properties import FileMeta
+
+
+class FileMetaStore:
+    def __init__(self, path: str):
+        """
+        A SQLite snapshot of resolved file metadata keyed by LOG_CHANNEL message id, so that a restart
+        starts with warm metadata instead of a get_messages call per file.
+
+        Queries run in a worker thread; WAL mode lets several processes share the same file.
+
+        Attributes:
+            path: database file, empty to disable the store.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files (message_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            connection.commit()
+            self.connection = connection
+        return self.connection
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(query, params).fetchall()
+            connection.commit()
+            return rows
+
+    async def execute(self, query: str, params: tuple = ()) -> list:
+        return await asyncio.to_thread(self._execute, query, params)
+
+    async def get(self, message_id: int, max_age: Optional[float] = None) -> Optional[FileMeta]:
+        """Returns the stored entry, or None if there is none or it was written more than max_age seconds ago."""
+        if not self.enabled:
+            return None
+        oldest = time.time() - max_age if max_age is not None else 0
+        try:
+            rows = await self.execute("SELECT data FROM files WHERE message_id = ? AND updated >= ?", (message_id, oldest))
+        except sqlite3.Error:
+            logging.warning(f"Failed to read message ID {message_id} from file store", exc_info=True)
+            return None
+        return FileMeta.from_dict(json.loads(rows[0][0])) if rows else None
+
+    async def put(self, message_id: int, meta: FileMeta) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.execute(
+                "INSERT OR REPLACE INTO files (message_id, data, updated) VALUES (?, ?, ?)",
+                (message_id, json.dumps(meta.to_dict()), time.time())
+            )
+        except sqlite3.Error:
+            logging.warning(f"Failed to write message ID {message_id} to file store", exc_info=True)
+
+    async def delete(self, message_id: int) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.execute("DELETE FROM files WHERE message_id = ?", (message_id,))
+        except sqlite3.Error:
+            logging.warning(f"Failed to delete message ID {message_id} from file store", exc_info=True)
+
+    async def recent(self, limit: int) -> Dict[int, FileMeta]:
+        """Returns the most recently updated entries, oldest first."""
+        if not self.enabled:
+            return {}
+        try:
+            rows = await self.execute("SELECT message_id, data FROM files ORDER BY updated DESC LIMIT ?", (limit,))
+        except sqlite3.Error:
+            logging.warning("Failed to load file store", exc_info=True)
+            return {}
+        return {message_id: FileMeta.from_dict(json.loads(data)) for message_id, data in reversed(rows)}
+
+
+file_store = FileMetaStore(FILE_META_DB)
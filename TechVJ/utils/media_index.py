@@ -0,0 +1,225 @@
+import struct
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from config import INDEX_CACHE_SIZE
+from .chunk_cache import CHUNK_SIZE
+from .range_planner import small_parts
+
+MAX_BOXES = 64
+MAX_INDEX_SIZE = 32 * 1024 * 1024
+MKV_HEAD_SIZE = 64 * 1024
+
+EBML_ID = 0x1A45DFA3
+SEGMENT_ID = 0x18538067
+SEEK_HEAD_ID = 0x114D9B74
+SEEK_ID = 0x4DBB
+SEEK_ID_ID = 0x53AB
+SEEK_POSITION_ID = 0x53AC
+CUES_ID = 0x1C53BB6B
+CLUSTER_ID = 0x1F43B675
+
+Reader = Callable[[int, int], Awaitable[bytes]]
+
+
+def read_vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """Reads an EBML variable length integer, returning (value, next position); unknown sizes are None."""
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable length integer")
+    if pos + length > len(data):
+        raise IndexError("Truncated EBML variable length integer")
+    value = int.from_bytes(data[pos:pos + length], "big")
+    if keep_marker:
+        return value, pos + length
+    value &= (1 << (7 * length)) - 1
+    if value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+async def locate_mp4(read: Reader, file_size: int) -> Optional[Tuple[int, int]]:
+    """Walks the top-level MP4 boxes and returns the inclusive byte range of the moov box."""
+    pos = 0
+    for _ in range(MAX_BOXES):
+        if pos + 8 > file_size:
+            return None
+        header = await read(pos, 16)
+        size, box = struct.unpack(">I4s", header[:8])
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+        elif size == 0:
+            size = file_size - pos
+        if size < 8:
+            return None
+        if box == b"moov":
+            return pos, min(pos + size, file_size) - 1
+        pos += size
+    return None
+
+
+async def locate_mkv(read: Reader, file_size: int) -> Optional[Tuple[int, int]]:
+    """Follows the Matroska SeekHead and returns the inclusive byte range of the Cues element."""
+    head = await read(0, min(file_size, MKV_HEAD_SIZE))
+    element, pos = read_vint(head, 0, True)
+    if element != EBML_ID:
+        return None
+    size, pos = read_vint(head, pos, False)
+    element, pos = read_vint(head, pos + size, True)
+    if element != SEGMENT_ID:
+        return None
+    _, segment_start = read_vint(head, pos, False)
+    pos = segment_start
+    cues_pos = None
+    while pos < len(head) - 12 and cues_pos is None:
+        start = pos
+        element, pos = read_vint(head, pos, True)
+        size, pos = read_vint(head, pos, False)
+        if element == CUES_ID and size is not None:
+            return start, min(pos + size, file_size) - 1
+        if element == CLUSTER_ID or size is None:
+            return None
+        if element == SEEK_HEAD_ID:
+            child = pos
+            while child < min(pos + size, len(head)):
+                child_id, child = read_vint(head, child, True)
+                child_size, child = read_vint(head, child, False)
+                if child_id == SEEK_ID:
+                    seek_id = seek_position = None
+                    field = child
+                    while field < child + child_size:
+                        field_id, field = read_vint(head, field, True)
+                        field_size, field = read_vint(head, field, False)
+                        value = int.from_bytes(head[field:field + field_size], "big")
+                        if field_id == SEEK_ID_ID:
+                            seek_id = value
+                        elif field_id == SEEK_POSITION_ID:
+                            seek_position = value
+                        field += field_size
+                    if seek_id == CUES_ID and seek_position is not None:
+                        cues_pos = segment_start + seek_position
+                        break
+                child += child_size
+        pos += size
+    if cues_pos is None or cues_pos >= file_size:
+        return None
+    header = await read(cues_pos, 12)
+    element, pos = read_vint(header, 0, True)
+    if element != CUES_ID:
+        return None
+    size, pos = read_vint(header, pos, False)
+    if size is None:
+        return None
+    return cues_pos, min(cues_pos + pos + size, file_size) - 1
+
+
+class IndexCache:
+    def __init__(self, max_bytes: int):
+        """
+        Pins the container index of video files - the MP4 moov box or the Matroska Cues - so that players
+        loading or seeking a hot video read it from memory instead of going back to Telegram.
+
+        The index is located on first access and kept as the whole CHUNK_SIZE aligned parts that cover it,
+        so any GetFile part inside that region can be sliced from memory.
+
+        Attributes:
+            max_bytes: byte budget; least recently used files are dropped above it.
+            located: per file_unique_id index range, or None when the file has no index worth pinning.
+        """
+        self.max_bytes = max_bytes
+        self.files: "OrderedDict[str, Dict[int, bytes]]" = OrderedDict()
+        self.located: "OrderedDict[str, Optional[Tuple[int, int]]]" = OrderedDict()
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.total_bytes = 0
+        self.hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, unique_id: str, offset: int, limit: int) -> Optional[bytes]:
+        chunks = self.files.get(unique_id)
+        if not chunks:
+            return None
+        base = offset - offset % CHUNK_SIZE
+        chunk = chunks.get(base)
+        if chunk is None:
+            return None
+        self.files.move_to_end(unique_id)
+        self.hits += 1
+        return chunk[offset - base:offset - base + limit]
+
+    def pin(self, unique_id: str, chunks: Dict[int, bytes]) -> None:
+        size = sum(len(chunk) for chunk in chunks.values())
+        if size > self.max_bytes:
+            return
+        previous = self.files.pop(unique_id, None)
+        if previous is not None:
+            self.total_bytes -= sum(len(chunk) for chunk in previous.values())
+        self.files[unique_id] = chunks
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            old_id, old = self.files.popitem(last=False)
+            self.total_bytes -= sum(len(chunk) for chunk in old.values())
+            self.located.pop(old_id, None)
+
+    def schedule(self, streamer, file_id, mime_type: str, file_name: str) -> None:
+        """Starts locating and pinning the index of a video in the background if that was not done yet."""
+        unique_id = file_id.unique_id
+        if not self.enabled or unique_id in self.located or unique_id in self.files or unique_id in self.tasks:
+            return
+        name = (file_name or "").lower()
+        if name.endswith((".mkv", ".webm")) or mime_type in ("video/x-matroska", "video/webm"):
+            locate = locate_mkv
+        elif name.endswith((".mp4", ".m4v", ".mov")) or mime_type in ("video/mp4", "video/quicktime"):
+            locate = locate_mp4
+        else:
+            self.remember(unique_id, None)
+            return
+        task = asyncio.create_task(self.load(streamer, file_id, locate))
+        self.tasks[unique_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(unique_id, None))
+
+    def remember(self, unique_id: str, region: Optional[Tuple[int, int]]) -> None:
+        self.located[unique_id] = region
+        while len(self.located) > 10000:
+            self.located.popitem(last=False)
+
+    async def load(self, streamer, file_id, locate: Callable[[Reader, int], Awaitable[Optional[Tuple[int, int]]]]) -> None:
+        unique_id = file_id.unique_id
+        region = None
+        try:
+            media_session = await streamer.generate_media_session(streamer.client, file_id)
+            location = await streamer.get_location(file_id)
+
+            async def read(pos: int, length: int) -> bytes:
+                end = min(pos + length, file_id.file_size) - 1
+                data = b""
+                for offset, limit, cut_start, cut_end in small_parts(pos, end):
+                    chunk = await streamer.fetch_part(file_id, media_session, location, offset, limit)
+                    data += chunk[cut_start:cut_end]
+                return data
+
+            region = await locate(read, file_id.file_size)
+            if region and region[1] - region[0] < MAX_INDEX_SIZE:
+                chunks = {}
+                for base in range(region[0] - region[0] % CHUNK_SIZE, region[1] + 1, CHUNK_SIZE):
+                    chunks[base] = await streamer.fetch_part(file_id, media_session, location, base, CHUNK_SIZE)
+                self.pin(unique_id, chunks)
+                logging.debug(f"Pinned index of {unique_id} at bytes {region[0]}-{region[1]}")
+        except (ValueError, IndexError, struct.error):
+            logging.debug(f"Could not parse the index of {unique_id}", exc_info=True)
+        except Exception:
+            logging.warning(f"Failed to load the index of {unique_id}", exc_info=True)
+            return
+        self.remember(unique_id, region)
+
+    def stats(self) -> Dict[str, int]:
+        return {"files": len(self.files), "bytes": self.total_bytes, "hits": self.hits}
+
+
+index_cache = IndexCache(INDEX_CACHE_SIZE * 1024 * 1024)
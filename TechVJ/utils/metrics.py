@@ -0,0 +1,118 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(4096 * 4 ** power for power in range(9))
+
+
+def format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        """A monotonically increasing value per label set; inc is a dict update, cheap enough for hot paths."""
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()):
+        """Counts observations into fixed cumulative buckets per label set, as Prometheus histograms do."""
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            # One slot per bucket, then +Inf, then the running sum
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket = format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket} {total}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {total}")
+        return lines
+
+
+class Sampled:
+    def __init__(self, name: str, kind: str, help: str, labelnames: Sequence[str], func: Callable[[], Iterable[Tuple[Labels, float]]]):
+        """A gauge or counter read from existing state when scraped, so it costs nothing between scrapes."""
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.func = func
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.func():
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """Holds every metric of the process and renders them in the Prometheus text exposition format."""
+        self.metrics: Dict[str, object] = {}
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def sample(self, name: str, kind: str, help: str, labelnames: Sequence[str] = ()):
+        """Decorator registering a function that returns (labels, value) pairs at scrape time."""
+        def decorator(func):
+            self.add(Sampled(name, kind, help, labelnames, func))
+            return func
+        return decorator
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+bytes_sent = registry.add(Counter("stream_bytes_sent_total", "Response body bytes sent to clients.", ("source",)))
+ttfb = registry.add(Histogram("stream_ttfb_seconds", "Time from request arrival to the first body byte."))
+range_size = registry.add(Histogram("stream_range_bytes", "Size of the byte ranges requested.", SIZE_BUCKETS))
+getfile_latency = registry.add(Histogram("getfile_latency_seconds", "GetFile round-trip time.", labelnames=("client",)))
+getfile_errors = registry.add(Counter("getfile_errors_total", "Failed GetFile calls.", ("client",)))
+flood_waits = registry.add(Counter("flood_waits_total", "FloodWait errors received.", ("client",)))
+flood_wait_seconds = registry.add(Counter("flood_wait_seconds_total", "Seconds of FloodWait imposed.", ("client",)))
+disk_lookups = registry.add(Counter("disk_cache_lookups_total", "Disk chunk cache lookups by result.", ("result",)))
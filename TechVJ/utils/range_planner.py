@@ -0,0 +1,105 @@
+import re
+from typing import List, Optional, Tuple
+from TechVJ.server.exceptions import RangeNotSatisfiable
+from .chunk_cache import CHUNK_SIZE
+
+MAX_RANGES = 32
+COALESCE_GAP = 80
+MIN_PART_LIMIT = 4 * 1024
+FIRST_PART_LIMIT = 64 * 1024
+SMALL_RANGE = 256 * 1024
+RANGE_SPEC = re.compile(r"^(\d*)-(\d*)$")
+
+
+def parse_range(header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses a Range header into inclusive (start, end) byte ranges following RFC 7233.
+
+    Supports "a-b", open ended "a-" and suffix "-n" specs, several of them separated by commas.
+    Overlapping ranges, and ranges separated by less than a multipart part header, are coalesced.
+
+    Returns:
+        The ranges sorted by start, or None if the header must be ignored and the whole file served.
+
+    Raises:
+        RangeNotSatisfiable: if no range overlaps the file.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        match = RANGE_SPEC.match(spec)
+        if not match or match.group(0) == "-":
+            return None
+        first, last = match.groups()
+        if not first:
+            length = int(last)
+            if length and file_size:
+                ranges.append((max(0, file_size - length), file_size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < file_size:
+            ranges.append((start, min(int(last), file_size - 1) if last else file_size - 1))
+    if not ranges:
+        raise RangeNotSatisfiable
+    ranges = coalesce(ranges)
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def coalesce(ranges: List[Tuple[int, int]], gap: int = COALESCE_GAP) -> List[Tuple[int, int]]:
+    """Merges overlapping ranges and ranges closer together than gap bytes."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def small_parts(start: int, end: int, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int, int, int]]:
+    """
+    Covers an inclusive byte range with the smallest GetFile parts MTProto allows: power of two limits
+    from 4 KiB up to chunk_size, each aligned to its own size so it never crosses a chunk boundary.
+    """
+    parts = []
+    offset = start - start % MIN_PART_LIMIT
+    while offset <= end:
+        limit = MIN_PART_LIMIT
+        while limit < chunk_size and offset + limit <= end:
+            limit *= 2
+        while offset % limit:
+            limit //= 2
+        parts.append((offset, limit, max(start - offset, 0), min(end + 1 - offset, limit)))
+        offset += limit
+    return parts
+
+
+def plan_parts(start: int, end: int, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int, int, int]]:
+    """
+    Maps an inclusive byte range onto GetFile parts as (offset, limit, cut_start, cut_end) tuples,
+    where chunk[cut_start:cut_end] of each part is what gets sent.
+
+    Short ranges such as header probes and small seeks are covered with small parts only. Longer ranges
+    start with one small head part for a fast first byte, fetched alongside full chunk_size parts for the
+    rest, which keep bulk throughput and the chunk caches aligned.
+    """
+    if end - start < SMALL_RANGE:
+        return small_parts(start, end, chunk_size)
+    parts = []
+    head_end = start - start % FIRST_PART_LIMIT + FIRST_PART_LIMIT
+    parts.extend(small_parts(start, head_end - 1, chunk_size))
+    start = head_end
+    offset = start - start % chunk_size
+    while offset <= end:
+        parts.append((offset, chunk_size, max(start - offset, 0), min(end + 1 - offset, chunk_size)))
+        offset += chunk_size
+    return parts
@@ -1,14 +1,75 @@
+import os
+import gzip
+import time
 import jinja2
+import asyncio
+import hashlib
 import logging
-import aiohttp
 import urllib.parse
-from config import LOG_CHANNEL, URL
-from TechVJ.bot import StreamBot
+from collections import OrderedDict
+from typing import Optional, Tuple
+from config import FILE_CACHE_TTL, PAGE_CACHE_SIZE
 from TechVJ.utils.human_readable import humanbytes
-from TechVJ.utils.file_properties import get_file_ids
+from TechVJ.utils.cluster import cluster
+from TechVJ.utils.file_cache import file_cache
+from TechVJ.utils.file_properties import FileMeta
 from TechVJ.server.exceptions import InvalidHash
 
-async def render_page(message_id: int, secure_hash: str, src: str = None) -> str:
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+environment = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(os.path.dirname(os.path.dirname(__file__)), "template")),
+    autoescape=jinja2.select_autoescape(["html"]),
+    auto_reload=False,
+)
+
+
+
+class Page:
+    __slots__ = ("etag", "bodies")
+
+    def __init__(self, html: str):
+        """
+        A rendered page with its compressed variants built once, so a page view only picks bytes.
+
+        Attributes:
+            etag: strong entity tag of the uncompressed page.
+            bodies: page bytes by content coding, "identity" always present, "br" only if brotli is installed.
+        """
+        body = html.encode("utf-8")
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11, mode=brotli.MODE_TEXT)
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """Picks the smallest variant the client accepts from its Accept-Encoding header."""
+        accepted = set()
+        for item in (accept_encoding or "").lower().split(","):
+            coding, _, params = item.partition(";")
+            q = params.strip().removeprefix("q=")
+            try:
+                if float(q or 1) <= 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(coding.strip())
+        for coding in ("br", "gzip"):
+            if coding in self.bodies and (coding in accepted or "*" in accepted):
+                return coding
+        return "identity"
+
+    def variant_etag(self, coding: str) -> str:
+        return f'"{self.etag}"' if coding == "identity" else f'"{self.etag}-{coding}"'
+
+
+# Rendered pages by (message_id, secure_hash, src) with the monotonic time they expire at
+page_cache: "OrderedDict[Tuple[int, str, Optional[str]], Tuple[Page, float]]" = OrderedDict()
+
+async def render_page(message_id: int, secure_hash: str, src: str = None, file_data: FileMeta = None) -> Page:
     """
     Render a download or media page for a specific Telegram file.
     
@@ -16,16 +77,24 @@ async def render_page(message_id: int, secure_hash: str, src: str = None) -> str
         message_id (int): The Telegram message ID containing the file.
         secure_hash (str): The first 6 characters of the file's unique ID to validate the link.
         src (str, optional): Optional custom source URL. Defaults to None.
+        file_data (FileMeta, optional): Already verified file properties, e.g. from a signed link. Defaults to None.
         
     Returns:
-        str: Rendered HTML content.
+        Page: Rendered HTML content with its precompressed variants.
         
     Raises:
         InvalidHash: If the hash doesn't match the file's unique ID.
     """
-    # Fetch the message and file properties
-    file_msg = await StreamBot.get_messages(int(LOG_CHANNEL), int(message_id))
-    file_data = await get_file_ids(StreamBot, int(LOG_CHANNEL), int(message_id))
+    # Serve a recently rendered page as is
+    key = (message_id, secure_hash, src)
+    cached = page_cache.get(key)
+    if cached and cached[1] > time.monotonic():
+        page_cache.move_to_end(key)
+        return cached[0]
+
+    # Fetch the file properties from the metadata cache shared with the streamer
+    if file_data is None:
+        file_data = await file_cache.get(int(message_id))
 
     # Validate secure hash
     if file_data.unique_id[:6] != secure_hash:
@@ -36,29 +105,16 @@ async def render_page(message_id: int, secure_hash: str, src: str = None) -> str
     # Construct file URL if not provided
     if not src:
         src = urllib.parse.urljoin(
-            URL,
+            cluster.url_for(int(message_id)),
             f"{message_id}/{urllib.parse.quote_plus(file_data.file_name)}?hash={secure_hash}"
         )
 
     # Determine file type and size
-    file_tag = file_data.mime_type.split("/")[0].strip()
+    file_tag = (file_data.mime_type or "").split("/")[0].strip()
     file_size = humanbytes(file_data.file_size)
 
-    # Select HTML template
-    if file_tag in ["video", "audio"]:
-        template_file = "TechVJ/template/req.html"
-    else:
-        template_file = "TechVJ/template/dl.html"
-        # Fetch real file size from headers for non-video/audio
-        async with aiohttp.ClientSession() as session:
-            async with session.get(src) as resp:
-                content_length = resp.headers.get("Content-Length")
-                if content_length:
-                    file_size = humanbytes(int(content_length))
-
-    # Load and render template
-    with open(template_file, "r", encoding="utf-8") as f:
-        template = jinja2.Template(f.read())
+    # Select the HTML template, compiled once and kept by the environment
+    template = environment.get_template("req.html" if file_tag in ["video", "audio"] else "dl.html")
 
     file_name = file_data.file_name.replace("_", " ")
 
@@ -69,4 +125,8 @@ async def render_page(message_id: int, secure_hash: str, src: str = None) -> str
         file_unique_id=file_data.unique_id,
     )
 
-    return html
\ No newline at end of file
+    page = await asyncio.to_thread(Page, html)
+    page_cache[key] = (page, time.monotonic() + FILE_CACHE_TTL)
+    while len(page_cache) > PAGE_CACHE_SIZE:
+        page_cache.popitem(last=False)
+    return page
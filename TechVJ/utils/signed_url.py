@@ -0,0 +1,89 @@
+import hmac
+import time
+import base64
+import struct
+import hashlib
+from typing import Optional
+from pyrogram.types import Message
+from pyrogram.file_id import FileId
+from config import BOT_TOKEN, STREAM_SECRET, LINK_EXPIRY
+from TechVJ.server.exceptions import InvalidHash, LinkExpired
+from .file_properties import FileMeta, get_media_from_message
+
+SIGNATURE_SIZE = 12
+HEADER = struct.Struct(">IQBI")
+
+secret = (STREAM_SECRET or hashlib.sha256(f"stream-link:{BOT_TOKEN}".encode()).hexdigest()).encode()
+
+
+class SignedLink:
+    __slots__ = ("message_id", "file_size", "dc_id", "expires", "unique_id", "mime_type")
+
+    def __init__(self, message_id: int, file_size: int, dc_id: int, expires: int, unique_id: str, mime_type: str):
+        """The file facts carried by a signed stream link, enough to answer a request without Telegram."""
+        self.message_id = message_id
+        self.file_size = file_size
+        self.dc_id = dc_id
+        self.expires = expires
+        self.unique_id = unique_id
+        self.mime_type = mime_type
+
+    def to_meta(self, file_name: str) -> FileMeta:
+        """Returns a FileMeta with the HTTP fields filled in; the location fields are resolved later."""
+        return FileMeta(self.file_size, self.mime_type, file_name, self.unique_id, self.dc_id, None)
+
+
+def mac(payload: bytes, file_name: str) -> bytes:
+    """Signs the token payload together with the file name of the link, which travels in the path instead of the token."""
+    return hmac.new(secret, payload + b"\0" + file_name.encode(), hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+
+def sign(message_id: int, file_size: int, dc_id: int, unique_id: str, mime_type: str, file_name: str = "",
+         expiry: int = LINK_EXPIRY) -> str:
+    """Encodes file facts and an HMAC of them and of the link's file name into a compact URL safe token."""
+    expires = int(time.time()) + expiry if expiry else 0
+    unique = unique_id.encode()
+    mime = (mime_type or "").encode()[:255]
+    payload = HEADER.pack(message_id, file_size, dc_id, expires) + bytes([len(unique)]) + unique + bytes([len(mime)]) + mime
+    signature = mac(payload, file_name)
+    return base64.urlsafe_b64encode(payload + signature).rstrip(b"=").decode()
+
+
+def sign_message(message: Message) -> Optional[str]:
+    """Returns a signed token for the media of a LOG_CHANNEL message, or None if it has no media."""
+    media = get_media_from_message(message)
+    if not media:
+        return None
+    return sign(
+        message.id,
+        getattr(media, "file_size", 0) or 0,
+        FileId.decode(media.file_id).dc_id,
+        media.file_unique_id,
+        getattr(media, "mime_type", "") or "",
+        getattr(media, "file_name", "") or "",
+    )
+
+
+def verify(token: str, file_name: str = "") -> SignedLink:
+    """
+    Decodes and checks a signed token against the file name in the link path.
+
+    Raises:
+        InvalidHash: if the token is malformed or its signature does not match the token and file name.
+        LinkExpired: if the token carries an expiry that has passed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload, signature = raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+        if not hmac.compare_digest(signature, mac(payload, file_name)):
+            raise InvalidHash
+        message_id, file_size, dc_id, expires = HEADER.unpack_from(payload)
+        pos = HEADER.size
+        unique = payload[pos + 1:pos + 1 + payload[pos]]
+        pos += 1 + payload[pos]
+        mime = payload[pos + 1:pos + 1 + payload[pos]]
+    except (ValueError, IndexError, struct.error):
+        raise InvalidHash
+    if expires and expires < time.time():
+        raise LinkExpired
+    return SignedLink(message_id, file_size, dc_id, expires, unique.decode(), mime.decode())
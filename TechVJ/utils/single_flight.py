@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Runs at most one call per key at a time; concurrent callers for the same key share its result.
+
+        The shared call is cancelled only once every caller waiting on it has been cancelled.
+        """
+        self.calls: Dict[Hashable, _Call] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        call = self.calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(func()))
+            self.calls[key] = call
+            call.task.add_done_callback(lambda _: self.forget(key, call))
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self.forget(key, call)
+
+    def forget(self, key: Hashable, call: _Call) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def __len__(self) -> int:
+        return len(self.calls)
@@ -0,0 +1,224 @@
+import json
+import time
+import asyncio
+import logging
+import secrets
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+from config import TRACE_REQUESTS, TRACE_BUFFER, TRACE_FILE
+
+# Spans of the same name recorded per trace; later ones are only counted, so a long download
+# keeps its first GetFile calls in full without growing a span per part
+MAX_SPANS_PER_NAME = 8
+FLUSH_INTERVAL = 5
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_dict(self, origin_ns: int) -> Dict[str, Any]:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.start_ns - origin_ns) / 1e6, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+    def to_otlp(self, trace_id: str) -> Dict[str, Any]:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2 if self.parent_id is None else 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Trace:
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        """
+        The spans of one HTTP request. The trace is finished when every holder released it:
+        the request handler, and the response body when it is streamed after the handler returned.
+
+        Attributes:
+            trace_id: random 128 bit id, hex encoded as OTLP expects.
+            root: the server span covering the whole request.
+            spans: finished child spans, at most MAX_SPANS_PER_NAME per span name.
+            counts: per span name, how many spans ran and their total seconds, including dropped ones.
+        """
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(name, None, attributes)
+        self.spans: List[Span] = []
+        self.counts: Dict[str, List[float]] = {}
+        self.holders = 0
+
+    def add(self, span: Span) -> None:
+        if self.root.end_ns:
+            # Background work started by the request, finishing after its trace was reported
+            return
+        count = self.counts.setdefault(span.name, [0, 0.0])
+        count[0] += 1
+        count[1] += span.duration
+        if count[0] <= MAX_SPANS_PER_NAME:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = [span.to_dict(self.root.start_ns) for span in sorted(self.spans, key=lambda span: span.start_ns)]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started": self.root.start_ns / 1e9,
+            "duration_ms": round(self.root.duration * 1000, 3),
+            "attributes": self.root.attributes,
+            "error": self.root.error,
+            "totals": {name: {"count": count, "total_ms": round(total * 1000, 3)} for name, (count, total) in self.counts.items()},
+            "spans": spans,
+        }
+
+    def to_otlp(self) -> List[Dict[str, Any]]:
+        return [self.root.to_otlp(self.trace_id)] + [span.to_otlp(self.trace_id) for span in self.spans]
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = TRACE_REQUESTS, buffer: int = TRACE_BUFFER, path: str = TRACE_FILE):
+        """
+        Records per request timing spans across the stream pipeline, keeps the most recent finished traces
+        in memory for /debug/requests and appends them as OTLP JSON lines to a file.
+
+        Attributes:
+            enabled: whether requests are traced at all.
+            recent: the last finished traces, oldest first.
+            path: file the OTLP export is appended to, empty to disable it.
+        """
+        self.enabled = enabled
+        self.recent: Deque[Trace] = deque(maxlen=buffer)
+        self.path = path
+        self.exports: List[Trace] = []
+        self.flusher: Optional[asyncio.Task] = None
+
+    def start(self, name: str, **attributes) -> Optional[Trace]:
+        """Starts a trace for the current request and makes it current, holding it once."""
+        if not self.enabled:
+            return None
+        trace = Trace(name, attributes)
+        trace.holders = 1
+        current_trace.set(trace)
+        current_span.set(trace.root.span_id)
+        return trace
+
+    def hold(self) -> Optional[Trace]:
+        """Keeps the current trace open until a matching release, e.g. while a response body streams."""
+        trace = current_trace.get()
+        if trace is not None:
+            trace.holders += 1
+        return trace
+
+    def release(self, trace: Optional[Trace]) -> None:
+        if trace is None:
+            return
+        trace.holders -= 1
+        if trace.holders > 0:
+            return
+        trace.root.end_ns = time.time_ns()
+        self.recent.append(trace)
+        if self.path:
+            self.exports.append(trace)
+            if self.flusher is None:
+                self.flusher = asyncio.create_task(self.flush_loop())
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Records the enclosed block as a child span of the current span, if a request is being traced."""
+        trace = current_trace.get()
+        if trace is None:
+            yield None
+            return
+        span = Span(name, current_span.get(), attributes)
+        token = current_span.set(span.span_id)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            span.end_ns = time.time_ns()
+            trace.add(span)
+
+    def record(self, trace: Optional[Trace], name: str, start_ns: int, error: Optional[str] = None, **attributes) -> None:
+        """Adds a span that ended now; for code that cannot wrap its block, such as async generators."""
+        if trace is None:
+            return
+        span = Span(name, trace.root.span_id, attributes)
+        span.start_ns = start_ns
+        span.end_ns = time.time_ns()
+        span.error = error
+        trace.add(span)
+
+    def slowest(self, limit: int) -> List[Dict[str, Any]]:
+        return [trace.to_dict() for trace in sorted(self.recent, key=lambda trace: trace.root.duration, reverse=True)[:limit]]
+
+    def write(self, traces: List[Trace]) -> None:
+        batch = {
+            "resourceSpans": [{
+                "resource": {"attributes": [otlp_attribute("service.name", "vj-file-store")]},
+                "scopeSpans": [{
+                    "scope": {"name": "TechVJ.utils.tracing"},
+                    "spans": [span for trace in traces for span in trace.to_otlp()],
+                }],
+            }]
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(batch, separators=(",", ":")) + "\n")
+
+    async def flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            if not self.exports:
+                continue
+            traces, self.exports = self.exports, []
+            try:
+                await asyncio.to_thread(self.write, traces)
+            except OSError:
+                logging.warning(f"Failed to export {len(traces)} traces to {self.path}", exc_info=True)
+
+
+tracer = Tracer()
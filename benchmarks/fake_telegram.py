@@ -0,0 +1,201 @@
+"""
+A local stand-in for Telegram used by the benchmarks: fake clients whose get_messages returns synthetic
+documents and whose media sessions answer upload.GetFile from generated bytes, with configurable latency,
+jitter and FloodWait injection.
+
+Import this module before anything from TechVJ or config: it points the caches at a scratch directory
+through the environment, which config reads at import time.
+"""
+import os
+import sys
+import random
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from typing import Dict, List
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="vj-bench-")
+
+os.environ.setdefault("FILE_META_DB", os.path.join(SCRATCH, "file_meta.db"))
+os.environ.setdefault("DISK_CACHE_DIR", "")
+os.environ.setdefault("MEDIA_SESSION_PREWARM", "False")
+os.environ.setdefault("TRACE_REQUESTS", "False")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import TechVJ.server  # noqa: E402  (must come before TechVJ.utils.custom_dl)
+from pyrogram import raw  # noqa: E402
+from pyrogram.errors import FloodWait  # noqa: E402
+from pyrogram.file_id import FileId, FileType  # noqa: E402
+from TechVJ.bot import multi_clients, work_loads, StreamBot  # noqa: E402
+from TechVJ.bot.scheduler import scheduler  # noqa: E402
+
+PATTERN_SIZE = 1024 * 1024 + 7
+FIRST_MESSAGE_ID = 1000
+DC_IDS = (1, 2, 3, 4, 5)
+
+
+class SyntheticFile:
+    def __init__(self, message_id: int, size: int, mime_type: str = "video/mp4", dc_id: int = 2):
+        """A file whose bytes are a seeded random pattern repeated, so any range can be produced and checked cheaply."""
+        self.message_id = message_id
+        self.size = size
+        self.mime_type = mime_type
+        self.dc_id = dc_id
+        self.unique_id = f"AgADbench{message_id:08d}"
+        self.file_name = f"bench-{message_id}.{mime_type.split('/')[1]}"
+        self.pattern = random.Random(message_id).randbytes(PATTERN_SIZE)
+        self.pattern += self.pattern
+        self.file_id = FileId(
+            file_type=FileType.DOCUMENT, dc_id=dc_id, media_id=message_id, access_hash=message_id * 7,
+            file_reference=b"bench",
+        ).encode()
+
+    @property
+    def hash(self) -> str:
+        return self.unique_id[:6]
+
+    def read(self, offset: int, length: int) -> bytes:
+        length = max(0, min(length, self.size - offset))
+        data = bytearray()
+        while length:
+            start = offset % PATTERN_SIZE
+            step = min(length, PATTERN_SIZE)
+            data += self.pattern[start:start + step]
+            offset += step
+            length -= step
+        return bytes(data)
+
+    def message(self) -> SimpleNamespace:
+        document = SimpleNamespace(
+            file_id=self.file_id, file_unique_id=self.unique_id, file_size=self.size,
+            mime_type=self.mime_type, file_name=self.file_name,
+        )
+        return SimpleNamespace(
+            id=self.message_id, empty=False, document=document, video=None, audio=None, photo=None,
+            sticker=None, animation=None, voice=None, video_note=None,
+        )
+
+
+class Backend:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, flood_rate: float = 0.0, flood_wait: int = 3,
+                 bandwidth: float = 0.0, seed: int = 1):
+        """
+        Shared behaviour of every fake client.
+
+        Attributes:
+            latency: mean GetFile round-trip time in seconds.
+            jitter: standard deviation added to the latency.
+            flood_rate: probability that a GetFile raises FloodWait.
+            flood_wait: seconds carried by injected FloodWait errors.
+            bandwidth: bytes per second of one media session, 0 for unlimited.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+        self.files: Dict[int, SyntheticFile] = {}
+        self.calls = 0
+        self.floods = 0
+        self.bytes = 0
+
+    def add_file(self, size: int, mime_type: str = "video/mp4") -> SyntheticFile:
+        message_id = FIRST_MESSAGE_ID + len(self.files)
+        file = SyntheticFile(message_id, size, mime_type, DC_IDS[message_id % len(DC_IDS)])
+        self.files[message_id] = file
+        return file
+
+    def delay(self, length: int) -> float:
+        delay = max(0.0, self.random.gauss(self.latency, self.jitter)) if self.latency else 0.0
+        if self.bandwidth:
+            delay += length / self.bandwidth
+        return delay
+
+
+class FakeMediaSession:
+    def __init__(self, backend: Backend, dc_id: int):
+        self.backend = backend
+        self.dc_id = dc_id
+
+    async def send(self, query, timeout: float = None):
+        backend = self.backend
+        backend.calls += 1
+        if isinstance(query, raw.functions.Ping):
+            return raw.types.Pong(msg_id=0, ping_id=query.ping_id)
+        if backend.flood_rate and backend.random.random() < backend.flood_rate:
+            backend.floods += 1
+            raise FloodWait(value=backend.flood_wait)
+        file = backend.files[query.location.id]
+        await asyncio.sleep(backend.delay(query.limit))
+        data = file.read(query.offset, query.limit)
+        backend.bytes += len(data)
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=data)
+
+    async def restart(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, backend: Backend, index: int):
+        """A client with a media session already open for every DC, so the session pool never authorizes."""
+        self.backend = backend
+        self.name = f"bench{index}"
+        self.username = "benchbot"
+        self.media_sessions = {dc_id: FakeMediaSession(backend, dc_id) for dc_id in DC_IDS}
+
+    async def get_messages(self, chat_id, message_ids):
+        await asyncio.sleep(self.backend.delay(0))
+        file = self.backend.files.get(message_ids)
+        return file.message() if file else SimpleNamespace(id=message_ids, empty=True)
+
+
+def install(backend: Backend, clients: int = 1) -> List[FakeClient]:
+    """Replaces the stream clients with fake ones backed by backend."""
+    multi_clients.clear()
+    work_loads.clear()
+    fakes = []
+    for index in range(clients):
+        client = FakeClient(backend, index)
+        multi_clients[index] = client
+        work_loads[index] = 0
+        scheduler.remove(index)
+        scheduler.set_home_dc(index, DC_IDS[index % len(DC_IDS)])
+        fakes.append(client)
+    StreamBot.username = "benchbot"
+    return fakes
+
+
+def file_url(file: SyntheticFile, signed: bool = False) -> str:
+    if signed:
+        from TechVJ.utils.signed_url import sign
+        token = sign(file.message_id, file.size, file.dc_id, file.unique_id, file.mime_type, file.file_name)
+        return f"/s/{token}/{quote(file.file_name, safe='')}"
+    return f"/{file.hash}{file.message_id}"
+
+
+def watch_url(file: SyntheticFile) -> str:
+    return f"/watch/{file.hash}{file.message_id}"
+
+
+def reset_caches() -> None:
+    """Empties every in-process cache so each workload starts cold."""
+    from TechVJ.utils.chunk_cache import memory_cache
+    from TechVJ.utils.file_cache import file_cache
+    from TechVJ.utils.media_index import index_cache
+    from TechVJ.utils.render_template import page_cache
+    memory_cache.probation.clear()
+    memory_cache.protected.clear()
+    memory_cache.probation_bytes = memory_cache.protected_bytes = 0
+    file_cache.entries.clear()
+    index_cache.files.clear()
+    index_cache.located.clear()
+    index_cache.total_bytes = 0
+    page_cache.clear()
+
@@ -0,0 +1,310 @@
+"""
+End-to-end HTTP load test: starts web_server() in a child process against the fake Telegram backend and
+ramps up simulated users until the server stops meeting its latency or error budget.
+
+Users are a mix of video players issuing overlapping range requests and seeks, segmented downloaders
+that split a file across parallel ranges, and watch page views. For each stage it reports request
+latency (time to first body byte) percentiles, throughput, the server's event loop lag and RSS.
+
+    python benchmarks/load_test.py --stages 10 50 100 200 --stage-seconds 30 --save load.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import multiprocessing
+from typing import Any, Dict, List
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stats import percentile  # noqa: E402
+
+MB = 1024 * 1024
+LAG_INTERVAL = 0.05
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def serve(port: int, options: Dict[str, Any]) -> None:
+    """Runs the stream server with the fake backend, plus routes exposing its files and health samples."""
+    import fake_telegram
+    from aiohttp import web
+    from TechVJ.server import web_server
+
+    backend = fake_telegram.Backend(
+        options["latency"], options["jitter"], options["flood_rate"], options["flood_wait"],
+        options["bandwidth"] * MB, options["seed"],
+    )
+    fake_telegram.install(backend, options["clients"])
+    files = [backend.add_file(options["file_size"] * MB) for _ in range(options["files"])]
+    lags: List[float] = []
+
+    async def sample_lag():
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(LAG_INTERVAL)
+            lags.append(time.monotonic() - started - LAG_INTERVAL)
+
+    async def stats_handler(_):
+        samples = lags[:]
+        lags.clear()
+        return web.json_response({
+            "lag_max_ms": round(max(samples, default=0) * 1000, 2),
+            "lag_p99_ms": round((percentile(samples, 99) or 0) * 1000, 2),
+            "rss_mb": round(rss_bytes() / MB, 1),
+            "getfile_calls": backend.calls,
+            "flood_waits": backend.floods,
+        })
+
+    async def files_handler(_):
+        return web.json_response([
+            {"url": fake_telegram.file_url(file), "watch": fake_telegram.watch_url(file), "size": file.size}
+            for file in files
+        ])
+
+    app = await web_server()
+    app.router.add_get("/_bench/stats", stats_handler)
+    app.router.add_get("/_bench/files", files_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    asyncio.create_task(sample_lag())
+    await asyncio.Event().wait()
+
+
+def serve_process(port: int, options: Dict[str, Any]) -> None:
+    asyncio.run(serve(port, options))
+
+
+class Stage:
+    def __init__(self, users: int):
+        """Measurements of one load level."""
+        self.users = users
+        self.latencies: List[float] = []
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.samples: List[Dict[str, Any]] = []
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        def ms(q):
+            value = percentile(self.latencies, q)
+            return None if value is None else round(value * 1000, 1)
+        return {
+            "users": self.users,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0,
+            "rps": round(self.requests / elapsed, 1),
+            "mb_per_s": round(self.bytes / MB / elapsed, 2),
+            "p50_ms": ms(50),
+            "p95_ms": ms(95),
+            "p99_ms": ms(99),
+            "lag_max_ms": max((sample["lag_max_ms"] for sample in self.samples), default=None),
+            "rss_mb": max((sample["rss_mb"] for sample in self.samples), default=None),
+        }
+
+
+class LoadTest:
+    def __init__(self, base_url: str, files: List[Dict[str, Any]], args):
+        self.base_url = base_url
+        self.files = files
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.stage: Stage = None
+        self.started = 0.0
+        self.timeline: List[Dict[str, Any]] = []
+
+    async def request(self, session: aiohttp.ClientSession, method: str, url: str, headers: Dict[str, str] = None,
+                      read_limit: int = None) -> int:
+        """Issues one request and reads up to read_limit body bytes, recording latency to the first byte."""
+        stage = self.stage
+        started = time.monotonic()
+        received = 0
+        try:
+            async with session.request(method, url, headers=headers) as resp:
+                if resp.status >= 400:
+                    stage.errors += 1
+                    return 0
+                first = True
+                async for chunk in resp.content.iter_any():
+                    if first:
+                        stage.latencies.append(time.monotonic() - started)
+                        first = False
+                    received += len(chunk)
+                    if read_limit is not None and received >= read_limit:
+                        break
+                if first:
+                    stage.latencies.append(time.monotonic() - started)
+                return int(resp.headers.get("Content-Length", 0))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            stage.errors += 1
+            return 0
+        finally:
+            stage.requests += 1
+            stage.bytes += received
+
+    async def player(self, session):
+        """Probes the start of a video, then plays overlapping windows with the occasional seek."""
+        file = self.random.choice(self.files)
+        size = file["size"]
+        await self.request(session, "GET", file["url"], {"Range": "bytes=0-"}, read_limit=256 * 1024)
+        position = 0
+        window = self.args.window * MB
+        for _ in range(self.args.player_windows):
+            if self.random.random() < 0.2:
+                position = self.random.randrange(0, max(1, size - window))
+            start = max(0, position - 64 * 1024)
+            end = min(size, position + window) - 1
+            await self.request(session, "GET", file["url"], {"Range": f"bytes={start}-{end}"})
+            position = end + 1
+            if position >= size:
+                break
+            await asyncio.sleep(self.args.think_time)
+
+    async def downloader(self, session):
+        """Splits a file into parallel ranges the way segmented download managers do."""
+        file = self.random.choice(self.files)
+        size = file["size"]
+        await self.request(session, "HEAD", file["url"])
+        segments = self.args.segments
+        step = -(-size // segments)
+        await asyncio.gather(*[
+            self.request(session, "GET", file["url"], {"Range": f"bytes={start}-{min(size, start + step) - 1}"})
+            for start in range(0, size, step)
+        ])
+
+    async def watcher(self, session):
+        file = self.random.choice(self.files)
+        await self.request(session, "GET", file["watch"], {"Accept-Encoding": "gzip, br"})
+
+    async def user(self, session, deadline: float):
+        scenarios = (self.player, self.downloader, self.watcher)
+        weights = (self.args.players, self.args.downloaders, self.args.watchers)
+        while time.monotonic() < deadline:
+            await self.random.choices(scenarios, weights)[0](session)
+
+    async def monitor(self, session, deadline: float):
+        while time.monotonic() < deadline:
+            await asyncio.sleep(1)
+            try:
+                async with session.get("/_bench/stats") as resp:
+                    sample = await resp.json()
+            except aiohttp.ClientError:
+                continue
+            sample["t"] = round(time.monotonic() - self.started, 1)
+            sample["users"] = self.stage.users
+            self.stage.samples.append(sample)
+            self.timeline.append(sample)
+
+    async def run(self) -> List[Dict[str, Any]]:
+        results = []
+        self.started = time.monotonic()
+        timeout = aiohttp.ClientTimeout(total=self.args.timeout)
+        connector = aiohttp.TCPConnector(limit=0, force_close=False)
+        print("".join(f"{column:>12}" for column in COLUMNS))
+        async with aiohttp.ClientSession(self.base_url, connector=connector, timeout=timeout) as session:
+            for users in self.args.stages:
+                self.stage = Stage(users)
+                deadline = time.monotonic() + self.args.stage_seconds
+                await asyncio.gather(self.monitor(session, deadline), *[self.user(session, deadline) for _ in range(users)])
+                summary = self.stage.summary()
+                summary["ok"] = summary["error_rate"] <= self.args.max_error_rate and (summary["p99_ms"] or 0) <= self.args.slo_ms
+                results.append(summary)
+                print_stage(summary)
+                if not summary["ok"] and not self.args.keep_going:
+                    break
+        return results
+
+
+COLUMNS = ("users", "requests", "error_rate", "rps", "mb_per_s", "p50_ms", "p95_ms", "p99_ms", "lag_max_ms", "rss_mb", "ok")
+
+
+def print_stage(summary: Dict[str, Any]) -> None:
+    print("".join(f"{str(summary[column]):>12}" for column in COLUMNS), flush=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(base_url: str, seconds: float = 60) -> List[Dict[str, Any]]:
+    deadline = time.monotonic() + seconds
+    async with aiohttp.ClientSession(base_url) as session:
+        while True:
+            try:
+                async with session.get("/_bench/files") as resp:
+                    return await resp.json()
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", type=int, nargs="+", default=[10, 25, 50, 100, 200], help="concurrent users per stage")
+    parser.add_argument("--stage-seconds", type=float, default=20)
+    parser.add_argument("--players", type=float, default=70, help="weight of video player users")
+    parser.add_argument("--downloaders", type=float, default=15, help="weight of segmented downloader users")
+    parser.add_argument("--watchers", type=float, default=15, help="weight of watch page users")
+    parser.add_argument("--window", type=float, default=2, help="MiB per player range request")
+    parser.add_argument("--player-windows", type=int, default=10, help="range requests per playback session")
+    parser.add_argument("--think-time", type=float, default=0.5, help="seconds a player waits between ranges")
+    parser.add_argument("--segments", type=int, default=8, help="parallel ranges per segmented download")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--file-size", type=int, default=64, help="MiB per synthetic file")
+    parser.add_argument("--clients", type=int, default=1, help="number of fake stream clients (MULTI_TOKEN bots)")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=float, default=0, help="MiB/s per media session, 0 for unlimited")
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--flood-wait", type=int, default=3)
+    parser.add_argument("--slo-ms", type=float, default=2000, help="p99 latency budget of a stage")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request in seconds")
+    parser.add_argument("--keep-going", action="store_true", help="run every stage even after one fails")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write stage results and the health timeline as JSON to this file")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = multiprocessing.get_context("spawn").Process(target=serve_process, args=(port, vars(args)), daemon=True)
+    server.start()
+    try:
+        files = asyncio.run(wait_ready(base_url))
+        test = LoadTest(base_url, files, args)
+        results = asyncio.run(test.run())
+    finally:
+        server.terminate()
+        server.join(5)
+
+    failed = next((stage for stage in results if not stage["ok"]), None)
+    if failed:
+        print(f"Falls over at {failed['users']} concurrent users")
+    else:
+        print(f"Held up to {results[-1]['users']} concurrent users")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": vars(args), "stages": results, "timeline": test.timeline}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
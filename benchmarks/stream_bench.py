@@ -0,0 +1,196 @@
+"""
+Offline streaming benchmark: drives media_streamer through aiohttp's test server against the fake Telegram
+backend and reports throughput, time to first byte and CPU per GB for a few download patterns.
+
+    python benchmarks/stream_bench.py --latency 0.05 --save before.json
+    python benchmarks/stream_bench.py --latency 0.05 --baseline before.json
+
+CPU time covers the whole process, so it includes the HTTP client; compare runs, not absolute numbers.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_telegram  # noqa: E402  (sets up the environment before TechVJ is imported)
+from fake_telegram import Backend, file_url, install, reset_caches  # noqa: E402
+from stats import percentile  # noqa: E402
+import aiohttp  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+from TechVJ.server import web_server  # noqa: E402
+
+MB = 1024 * 1024
+
+
+class Result:
+    def __init__(self, name: str):
+        """Timings of one workload; ttfb holds seconds to the first body byte of each request."""
+        self.name = name
+        self.ttfb: List[float] = []
+        self.bytes = 0
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.cpu = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        def ms(q):
+            value = percentile(self.ttfb, q)
+            return None if value is None else round(value * 1000, 2)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "mb": round(self.bytes / MB, 1),
+            "seconds": round(self.seconds, 3),
+            "mb_per_s": round(self.bytes / MB / self.seconds, 2) if self.seconds else 0,
+            "ttfb_p50_ms": ms(50),
+            "ttfb_p95_ms": ms(95),
+            "ttfb_p99_ms": ms(99),
+            "cpu_s_per_gb": round(self.cpu / (self.bytes / 1024 ** 3), 2) if self.bytes else None,
+        }
+
+
+async def fetch(session: aiohttp.ClientSession, url: str, result: Result, headers: Dict[str, str] = None,
+                expected: int = None) -> None:
+    start = time.monotonic()
+    first = None
+    received = 0
+    try:
+        async with session.get(url, headers=headers) as resp:
+            if resp.status not in (200, 206):
+                result.errors += 1
+                return
+            async for chunk in resp.content.iter_any():
+                if first is None:
+                    first = time.monotonic() - start
+                received += len(chunk)
+        if expected is not None and received != expected:
+            result.errors += 1
+    except aiohttp.ClientError:
+        result.errors += 1
+    finally:
+        result.requests += 1
+        result.bytes += received
+        if first is not None:
+            result.ttfb.append(first)
+
+
+async def sequential(session, files, args) -> Result:
+    """Whole-file downloads one after another."""
+    result = Result("sequential")
+    for i in range(args.requests):
+        file = files[i % len(files)]
+        await fetch(session, file_url(file), result, expected=file.size)
+    return result
+
+
+async def random_seek(session, files, args) -> Result:
+    """Short ranges at random offsets, a few at a time, like a player scrubbing through videos."""
+    result = Result("random_seek")
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(4)
+
+    async def one(i: int):
+        file = files[i % len(files)]
+        start = rng.randrange(0, max(1, file.size - args.seek_size))
+        end = min(file.size, start + args.seek_size) - 1
+        async with semaphore:
+            await fetch(session, file_url(file), result, {"Range": f"bytes={start}-{end}"}, end - start + 1)
+
+    await asyncio.gather(*[one(i) for i in range(args.requests * 8)])
+    return result
+
+
+async def concurrent(session, files, args) -> Result:
+    """Many viewers downloading at once, several of them on the same files."""
+    result = Result("concurrent")
+    await asyncio.gather(*[
+        fetch(session, file_url(files[i % len(files)]), result, expected=files[i % len(files)].size)
+        for i in range(args.viewers)
+    ])
+    return result
+
+
+WORKLOADS = {"sequential": sequential, "random_seek": random_seek, "concurrent": concurrent}
+
+
+async def run(args) -> Dict[str, Dict[str, Any]]:
+    backend = Backend(args.latency, args.jitter, args.flood_rate, args.flood_wait, args.bandwidth * MB, args.seed)
+    install(backend, args.clients)
+    files = [backend.add_file(args.file_size * MB) for _ in range(args.files)]
+    server = TestServer(await web_server())
+    await server.start_server()
+    results = {}
+    try:
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(base_url=server.make_url("/"), connector=connector) as session:
+            for name in args.workloads:
+                reset_caches()
+                calls = backend.calls
+                started, cpu = time.monotonic(), time.process_time()
+                result = await WORKLOADS[name](session, files, args)
+                result.seconds = time.monotonic() - started
+                result.cpu = time.process_time() - cpu
+                results[name] = result.summary()
+                results[name]["getfile_calls"] = backend.calls - calls
+    finally:
+        await server.close()
+    results["_config"] = {key: value for key, value in vars(args).items() if key not in ("save", "baseline")}
+    return results
+
+
+def report(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]] = None) -> None:
+    columns = ("requests", "errors", "mb", "mb_per_s", "ttfb_p50_ms", "ttfb_p95_ms", "ttfb_p99_ms", "cpu_s_per_gb", "getfile_calls")
+    print(f"{'workload':<14}" + "".join(f"{column:>15}" for column in columns))
+    for name, summary in results.items():
+        if name.startswith("_"):
+            continue
+        print(f"{name:<14}" + "".join(f"{str(summary.get(column)):>15}" for column in columns))
+        old = (baseline or {}).get(name)
+        if old:
+            deltas = []
+            for column in columns:
+                if isinstance(summary.get(column), (int, float)) and isinstance(old.get(column), (int, float)) and old[column]:
+                    deltas.append(f"{(summary[column] - old[column]) / old[column] * 100:+.1f}%")
+                else:
+                    deltas.append("")
+            print(f"{'  vs baseline':<14}" + "".join(f"{delta:>15}" for delta in deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--files", type=int, default=4, help="number of synthetic files")
+    parser.add_argument("--file-size", type=int, default=32, help="size of each file in MiB")
+    parser.add_argument("--requests", type=int, default=8, help="downloads in the sequential workload")
+    parser.add_argument("--viewers", type=int, default=32, help="simultaneous downloads in the concurrent workload")
+    parser.add_argument("--seek-size", type=int, default=256 * 1024, help="bytes per random seek request")
+    parser.add_argument("--clients", type=int, default=1, help="number of fake stream clients")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean GetFile latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="GetFile latency standard deviation")
+    parser.add_argument("--bandwidth", type=float, default=0, help="MiB/s per media session, 0 for unlimited")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="probability of FloodWait per GetFile")
+    parser.add_argument("--flood-wait", type=int, default=3, help="seconds carried by injected FloodWait")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ import logging
 import logging.config
 from pyrogram import idle
 from pyrogram import Client, __version__
-from config import LOG_CHANNEL, ON_HEROKU, CLONE_MODE, PORT
+from config import LOG_CHANNEL, ON_HEROKU, CLONE_MODE, PORT, MEDIA_SESSION_PREWARM, STREAM_WORKERS
 from typing import Union, Optional, AsyncGenerator
 from pyrogram import types
 from Script import script 
@@ -18,9 +18,12 @@ from aiohttp import web
 from TechVJ.server import web_server
 import asyncio
 from plugins.clone import restart_bots
-from TechVJ.bot import StreamBot
+from TechVJ.bot import StreamBot, multi_clients
 from TechVJ.utils.keepalive import ping_server
 from TechVJ.bot.clients import initialize_clients
+from TechVJ.bot.session_pool import session_pool
+from TechVJ.utils.file_cache import file_cache
+from TechVJ.server.workers import worker_pool
 
 # Logging configuration
 logging.config.fileConfig('logging.conf')
@@ -40,7 +43,17 @@ async def start():
     bot_info = await StreamBot.get_me()
     StreamBot.username = bot_info.username
 
-    await initialize_clients()
+    if STREAM_WORKERS and not worker_pool.supported():
+        logging.error("SO_REUSEPORT is not available, serving streams from the bot process")
+    elif STREAM_WORKERS:
+        worker_pool.start()
+        asyncio.create_task(worker_pool.supervise())
+    if not worker_pool.processes:
+        await initialize_clients()
+        await file_cache.warm()
+        if MEDIA_SESSION_PREWARM:
+            asyncio.create_task(session_pool.prewarm(multi_clients.values()))
+        asyncio.create_task(session_pool.maintain())
 
     for name in files:
         with open(name) as a:
@@ -62,11 +75,12 @@ async def start():
     now = datetime.now(tz)
     time_str = now.strftime("%H:%M:%S %p")
 
-    app = web.AppRunner(await web_server())
     await StreamBot.send_message(chat_id=LOG_CHANNEL, text=script.RESTART_TXT.format(today, time_str))
-    await app.setup()
-    bind_address = "0.0.0.0"
-    await web.TCPSite(app, bind_address, PORT).start()
+    if not worker_pool.processes:
+        app = web.AppRunner(await web_server())
+        await app.setup()
+        bind_address = "0.0.0.0"
+        await web.TCPSite(app, bind_address, PORT).start()
 
     if CLONE_MODE:
         await restart_bots()
@@ -74,6 +88,7 @@ async def start():
     print("Bot Started Powered By @VJ_Botz")
 
     await idle()
+    worker_pool.stop()
     await StreamBot.stop()
 
 if __name__ == '__main__':
@@ -76,6 +76,37 @@ STREAM_MODE = bool(environ.get('STREAM_MODE', False)) # Set True or False
 MULTI_CLIENT = False
 SLEEP_THRESHOLD = int(environ.get('SLEEP_THRESHOLD', '60'))
 PING_INTERVAL = int(environ.get("PING_INTERVAL", "1200"))  # 20 minutes
+MULTI_TOKEN_FILE = environ.get("MULTI_TOKEN_FILE", "")  # File with one extra stream client bot token per line, reread when it changes
+CLIENT_PROBE_INTERVAL = int(environ.get("CLIENT_PROBE_INTERVAL", "60"))  # Seconds between health probes of each stream client
+CLIENT_PROBE_FAILURES = int(environ.get("CLIENT_PROBE_FAILURES", "3"))  # Failed probes in a row before a stream client is drained and restarted
+CLIENT_RETRY_DELAY = int(environ.get("CLIENT_RETRY_DELAY", "30"))  # First backoff in seconds before restarting a failed stream client
+CLIENT_DRAIN_TIMEOUT = int(environ.get("CLIENT_DRAIN_TIMEOUT", "300"))  # Seconds a draining stream client may finish its streams
+STREAM_WORKERS = int(environ.get("STREAM_WORKERS", "0"))  # Stream server processes sharing PORT with SO_REUSEPORT, 0 to serve from the bot process
+CLUSTER_NODES = environ.get("CLUSTER_NODES", "")  # Comma separated base URLs of every stream node, empty to run a single node
+CLUSTER_NODES_FILE = environ.get("CLUSTER_NODES_FILE", "")  # File with one stream node base URL per line, reread when it changes
+CLUSTER_SELF = environ.get("CLUSTER_SELF", "")  # Base URL of this node as listed in the cluster, defaults to URL
+CLUSTER_PROXY = is_enabled(environ.get("CLUSTER_PROXY", "False"), False)  # Proxy requests for files owned by other nodes instead of redirecting
+STREAM_SECRET = environ.get("STREAM_SECRET", "")  # Key for signed stream links, derived from BOT_TOKEN if empty
+LINK_EXPIRY = int(environ.get("LINK_EXPIRY", "0"))  # Lifetime of signed stream links in seconds, 0 means they never expire
+STREAM_PREFETCH = int(environ.get("STREAM_PREFETCH", "4"))  # Max GetFile requests in flight per stream
+STRIPED_STREAM = is_enabled(environ.get("STRIPED_STREAM", "False"), False)  # Fetch parts of one download through several clients
+STRIPE_WIDTH = int(environ.get("STRIPE_WIDTH", "0"))  # Max clients per striped download, 0 means all
+MEDIA_SESSION_PREWARM = is_enabled(environ.get("MEDIA_SESSION_PREWARM", "True"), True)  # Open media sessions for all DCs at startup and whenever a stream client starts
+MEDIA_SESSION_HEALTH = int(environ.get("MEDIA_SESSION_HEALTH", "60"))  # Seconds between media session health checks
+MEDIA_SESSION_IDLE = int(environ.get("MEDIA_SESSION_IDLE", "0"))  # Stop foreign DC media sessions idle this long, 0 to keep them
+MEDIA_AUTH_DB = environ.get("MEDIA_AUTH_DB", "cache/media_auth.db")  # Encrypted store of foreign DC media auth keys reused across restarts, empty to disable
+MEDIA_AUTH_SECRET = environ.get("MEDIA_AUTH_SECRET", "")  # Key for the media auth key store, derived from BOT_TOKEN if empty
+FILE_CACHE_SIZE = int(environ.get("FILE_CACHE_SIZE", "10000"))  # Max cached file metadata entries
+FILE_CACHE_TTL = int(environ.get("FILE_CACHE_TTL", "1800"))  # Average lifetime of cached file metadata in seconds
+FILE_META_DB = environ.get("FILE_META_DB", "cache/file_meta.db")  # SQLite snapshot of file metadata, empty to disable
+PAGE_CACHE_SIZE = int(environ.get("PAGE_CACHE_SIZE", "1000"))  # Number of rendered watch pages kept in memory
+MEMORY_CACHE_SIZE = int(environ.get("MEMORY_CACHE_SIZE", "64"))  # In-memory hot chunk cache budget in MiB
+INDEX_CACHE_SIZE = int(environ.get("INDEX_CACHE_SIZE", "64"))  # Memory budget in MiB for pinned MP4/MKV indexes
+DISK_CACHE_DIR = environ.get("DISK_CACHE_DIR", "cache/chunks")  # Empty to disable the disk chunk cache
+DISK_CACHE_SIZE = int(environ.get("DISK_CACHE_SIZE", "1024"))  # Disk chunk cache budget in MiB
+TRACE_REQUESTS = is_enabled(environ.get("TRACE_REQUESTS", "False"), False)  # Record per request timing spans for /debug/requests
+TRACE_BUFFER = int(environ.get("TRACE_BUFFER", "500"))  # Number of recent request traces kept in memory
+TRACE_FILE = environ.get("TRACE_FILE", "")  # File to append traces to as OTLP JSON lines, empty to disable
 if 'DYNO' in environ:
     ON_HEROKU = True
 else:
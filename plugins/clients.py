@@ -0,0 +1,50 @@
+import re
+from pyrogram import Client, filters
+from config import ADMINS
+from TechVJ.bot.fleet import client_fleet
+
+TOKEN_PATTERN = re.compile(r"\b(\d+:[A-Za-z0-9_-]{30,})\b")
+
+# ------------------ STREAM CLIENT FLEET ------------------ #
+
+@Client.on_message(filters.command("clients") & filters.user(ADMINS))
+async def clients_handler(bot, message):
+    """Show the MULTI_TOKEN stream clients and their health"""
+    stats = client_fleet.stats()
+    if not stats:
+        return await message.reply_text("**No stream clients are managed by this process.**")
+    lines = []
+    for index, member in stats.items():
+        retry = f", retry in {member['retry_in']}s" if member["retry_in"] else ""
+        lines.append(f"`{index}` bot {member['bot_id']}: {member['state']}{retry}")
+    await message.reply_text("**Stream clients**\n\n" + "\n".join(lines))
+
+@Client.on_message(filters.command("addclient") & filters.user(ADMINS))
+async def add_client_handler(bot, message):
+    """Add a stream client bot token at runtime"""
+    if not client_fleet.token_file:
+        return await message.reply_text("**Set MULTI_TOKEN_FILE to manage stream clients at runtime.**")
+    match = TOKEN_PATTERN.search(message.text or "")
+    try:
+        await message.delete()
+    except Exception:
+        pass
+    if not match:
+        return await message.reply_text("**Usage:** `/addclient <bot token>`")
+    if not await client_fleet.add_token(match.group(1)):
+        return await message.reply_text("**This bot is already a stream client.**")
+    await message.reply_text("**Stream client added.** It starts within a few seconds, see /clients.")
+
+@Client.on_message(filters.command("removeclient") & filters.user(ADMINS))
+async def remove_client_handler(bot, message):
+    """Remove a stream client by bot id at runtime; its streams finish before it stops"""
+    if not client_fleet.token_file:
+        return await message.reply_text("**Set MULTI_TOKEN_FILE to manage stream clients at runtime.**")
+    if len(message.command) < 2 or not message.command[1].isdigit():
+        return await message.reply_text("**Usage:** `/removeclient <bot id>`")
+    where = await client_fleet.remove_token(int(message.command[1]))
+    if where == "env":
+        return await message.reply_text("**This bot is set in a MULTI_TOKEN variable, remove it there.**")
+    if where is None:
+        return await message.reply_text("**No stream client with this bot id.**")
+    await message.reply_text("**Stream client removed.** It is drained and stopped once its streams finish.")
@@ -4,7 +4,7 @@ import random
 import asyncio
 import json
 import base64
-from urllib.parse import quote_plus
+from urllib.parse import quote
 from validators import domain
 
 from pyrogram import Client, filters, enums
@@ -16,7 +16,9 @@ from plugins.dbusers import db
 from plugins.users_api import get_user, update_user_info
 from utils import verify_user, check_token, check_verification, get_token
 from config import *
-from TechVJ.utils.file_properties import get_name, get_hash, get_media_file_size
+from TechVJ.utils.file_properties import get_name, get_media_file_size
+from TechVJ.utils.signed_url import sign_message
+from TechVJ.utils.cluster import cluster
 
 logger = logging.getLogger(__name__)
 
@@ -175,8 +177,11 @@ async def start(client, message):
 
                 reply_markup = None
                 if STREAM_MODE and (info.video or info.document):
-                    stream_url = f"{URL}watch/{info.id}/{quote_plus(get_name(info))}?hash={get_hash(info)}"
-                    download_url = f"{URL}{info.id}/{quote_plus(get_name(info))}?hash={get_hash(info)}"
+                    token = sign_message(info)
+                    base_url = cluster.url_for(info.id)
+                    link_name = quote(get_name(info) or "", safe="")
+                    stream_url = f"{base_url}watch/s/{token}/{link_name}"
+                    download_url = f"{base_url}s/{token}/{link_name}"
                     button = [
                         [InlineKeyboardButton("• ᴅᴏᴡɴʟᴏᴀᴅ •", url=download_url),
                          InlineKeyboardButton("• ᴡᴀᴛᴄʜ •", url=stream_url)],
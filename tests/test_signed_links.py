@@ -0,0 +1,68 @@
+"""
+Signed stream links must round-trip any file name: the name is signed, percent-encoded into the link
+path and checked against the path aiohttp has already decoded.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_telegram  # noqa: E402  (sets up the environment before TechVJ is imported)
+import pytest  # noqa: E402
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+from TechVJ.server import web_server  # noqa: E402
+
+NAMES = ["C++ course.mp4", "100% done.mp4", "a %41 b+c.mkv", "plain.mp4", ""]
+
+
+async def fetch(paths):
+    backend = fake_telegram.Backend(latency=0, jitter=0)
+    fake_telegram.install(backend)
+    fake_telegram.reset_caches()
+    client = TestClient(TestServer(await web_server()))
+    await client.start_server()
+    try:
+        results = []
+        for make_path in paths:
+            file = backend.add_file(64 * 1024)
+            path, expected = make_path(file)
+            async with client.get(path, headers={"Range": "bytes=0-99"}) as resp:
+                results.append((resp.status, await resp.read(), resp.headers.get("Content-Disposition"), file, expected))
+        return results
+    finally:
+        await client.close()
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_signed_link_serves_any_name(name):
+    def make_path(file):
+        file.file_name = name
+        return fake_telegram.file_url(file, signed=True), name
+
+    [(status, body, disposition, file, expected)] = asyncio.run(fetch([make_path]))
+    assert status == 206
+    assert body == file.read(0, 100)
+    if expected:
+        assert disposition == f'attachment; filename="{expected}"'
+
+
+def test_renamed_signed_link_is_rejected():
+    def make_path(file):
+        file.file_name = "C++ course.mp4"
+        return fake_telegram.file_url(file, signed=True).replace("C%2B%2B", "C%20%20"), None
+
+    [(status, *_)] = asyncio.run(fetch([make_path]))
+    assert status == 403
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_signed_watch_page_links_to_same_name(name):
+    def make_path(file):
+        file.file_name = name
+        return "/watch" + fake_telegram.file_url(file, signed=True), fake_telegram.file_url(file, signed=True)
+
+    [(status, body, _, _, expected)] = asyncio.run(fetch([make_path]))
+    assert status == 200
+    assert expected.encode() in body